@@ -0,0 +1,90 @@
+# aiclient.py
+# One OpenAI client per process, shared by chat and voice.
+# The client keeps an httpx connection pool alive between
+# requests so only the first one pays the TCP and TLS handshakes.
+# openai and httpx are imported on first use, not at startup.
+#
+
+import os
+import threading
+
+_lock = threading.Lock()
+_client = None
+_settings = {
+    'key': None,             # name of the env variable holding the key
+    'pool_size': 4,          # connections kept in the pool
+    'timeout': 60.0,         # seconds to wait for (each part of) a reply
+    'connect_timeout': 10.0, # seconds to open a connection
+}
+
+
+def configure(key=None, pool_size=4, timeout=60.0, connect_timeout=10.0):
+    ''' set the client settings
+        the shared client is rebuilt only if a setting changed '''
+    global _client
+    new = {
+        'key': key,
+        'pool_size': max(1, int(pool_size)),
+        'timeout': float(timeout),
+        'connect_timeout': float(connect_timeout),
+    }
+    with _lock:
+        if new == _settings:
+            return
+        _settings.update(new)
+        old, _client = _client, None
+    if old is not None:
+        old.close()
+
+
+def get_client(key=None):
+    ''' return the shared client, building it on first use
+        key: env variable name, the client is rebuilt if it changes '''
+    global _client
+    if key is not None and key != _settings['key']:
+        configure(key, _settings['pool_size'], _settings['timeout'],
+                  _settings['connect_timeout'])
+    with _lock:
+        if _client is None:
+            _client = _build()
+        return _client
+
+
+def _build():
+    import httpx
+    from openai import OpenAI
+    limits = httpx.Limits(
+        max_connections=_settings['pool_size'],
+        max_keepalive_connections=_settings['pool_size'],
+        keepalive_expiry=120.0)
+    timeout = httpx.Timeout(_settings['timeout'],
+                            connect=_settings['connect_timeout'])
+    api_key = None
+    if _settings['key']:
+        api_key = os.environ.get(_settings['key'])
+    return OpenAI(
+        api_key=api_key,
+        timeout=timeout,
+        max_retries=0,  # retry.py does the retries
+        http_client=httpx.Client(limits=limits, timeout=timeout))
+
+
+def preload():
+    ''' import openai on a background thread '''
+    def run():
+        try:
+            import openai
+        except ImportError:
+            pass
+    threading.Thread(target=run, daemon=True).start()
+
+
+def warm_up():
+    ''' open a pooled connection on a background thread
+        so the first real request finds it ready '''
+    def run():
+        try:
+            get_client().models.list()
+        except Exception:
+            pass  # the first request will report any problem
+    threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,202 @@
+# attach.py
+# Local files given to the model as context (Shift-Ctrl-A) instead of
+# being pasted into the prompt box.
+#   - files are read on a worker thread, large ones through mmap, and
+#     cut at line ends into chunks of about CHUNK_CHARS
+#   - each chunk is known by the sha256 of its text: a chunk already
+#     sent in a message that is still in the context is referred to,
+#     not sent again, so an unchanged file costs nothing on later turns
+#   - when the chunks do not fit in the token budget they are ranked
+#     against the prompt with BM25 (offline, no index to keep) and only
+#     the best ones are sent, in file order
+#
+
+import hashlib
+import math
+import mmap
+import os
+import re
+from collections import Counter
+
+import context
+
+CHUNK_CHARS = 4000      # about 1000 tokens
+MMAP_SIZE = 1 << 20     # files from this size on are memory-mapped
+BINARY_PROBE = 8192     # bytes looked at for a NUL
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+WORD = re.compile(r"\w+")
+
+
+def words(text):
+    return WORD.findall(text.lower())
+
+
+class Chunk:
+    ''' lines first..last of a file '''
+    def __init__(self, path, first, last, text):
+        self.path = path
+        self.first = first
+        self.last = last
+        self.text = text
+        self.hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        self.terms = Counter(words(text))
+        self.length = sum(self.terms.values())
+        self.tokens = context.count_tokens(text) + context.MSG_OVERHEAD
+
+    def label(self):
+        return f"{os.path.basename(self.path)} lines {self.first}-{self.last} #{self.hash[:8]}"
+
+
+def read_chunks(path, size=CHUNK_CHARS):
+    ''' the chunks of a text file, ValueError if it is binary '''
+    with open(path, "rb") as f:
+        length = os.fstat(f.fileno()).st_size
+        if b"\0" in f.read(BINARY_PROBE):
+            raise ValueError(f"{os.path.basename(path)} is not a text file")
+        if length == 0:
+            return []
+        if length < MMAP_SIZE:
+            f.seek(0)
+            return list(cut(path, f.read(), size))
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return list(cut(path, data, size))
+        finally:
+            data.close()
+
+
+def cut(path, data, size):
+    ''' chunks of data (bytes or mmap) ending at a line end, a line
+        longer than 2 * size is split at a character boundary '''
+    pos, line = 0, 1
+    while pos < len(data):
+        end = data.find(b"\n", pos + size)
+        end = len(data) if end < 0 else end + 1
+        if end - pos > 2 * size:
+            end = pos + 2 * size
+            while data[end] & 0xC0 == 0x80:  # inside a UTF-8 character
+                end -= 1
+        raw = data[pos:end]
+        lines = raw.count(b"\n")
+        last = line + lines - (1 if raw.endswith(b"\n") else 0)
+        yield Chunk(path, line, max(line, last), raw.decode("utf-8", "replace"))
+        line += lines
+        pos = end
+
+
+def read_files(job, paths):
+    ''' runs on the file worker: [(path, chunks, problem)] '''
+    files = []
+    for path in paths:
+        if job.is_cancelled():
+            break
+        try:
+            files.append((path, read_chunks(path), None))
+        except (OSError, ValueError) as e:
+            files.append((path, [], str(e)))
+    return files
+
+
+class Attachments:
+    ''' the attached files and the chunks already sent '''
+
+    def __init__(self):
+        self.files = {}      # path -> chunks, in the order attached
+        self.df = Counter()  # term -> chunks holding it
+        self.sent = {}       # chunk hash -> the message that carried it
+
+    def __bool__(self):
+        return bool(self.files)
+
+    def add(self, path, chunks):
+        ''' attach path, again if it was (its unchanged chunks keep
+            their hash and are not sent again) '''
+        self.remove(path)
+        self.files[path] = chunks
+        for c in chunks:
+            self.df.update(c.terms.keys())
+
+    def remove(self, path):
+        for c in self.files.pop(path, ()):
+            self.df.subtract(c.terms.keys())
+
+    def clear(self):
+        self.files.clear()
+        self.df.clear()
+        self.sent.clear()
+
+    def chunks(self):
+        ''' every chunk once, in file order '''
+        seen = set()
+        out = []
+        for chunks in self.files.values():
+            for c in chunks:
+                if c.hash not in seen:
+                    seen.add(c.hash)
+                    out.append(c)
+        return out
+
+    def describe(self):
+        names = ", ".join(os.path.basename(p) for p in self.files)
+        return f"{len(self.files)} file(s) attached: {names}"
+
+    def rank(self, query, chunks):
+        ''' chunks, the best BM25 match for query first '''
+        terms = set(words(query))
+        if not terms or not chunks:
+            return list(chunks)
+        n = len(chunks)
+        avg = sum(c.length for c in chunks) / len(chunks) or 1.0
+        idf = {t: math.log(1 + (n - self.df[t] + 0.5) / (self.df[t] + 0.5))
+               for t in terms if self.df[t] > 0}
+
+        def score(c):
+            s = 0.0
+            for t, w in idf.items():
+                tf = c.terms.get(t, 0)
+                if tf:
+                    s += w * tf * (BM25_K1 + 1) / (
+                        tf + BM25_K1 * (1 - BM25_B + BM25_B * c.length / avg))
+            return s
+
+        return sorted(chunks, key=score, reverse=True)  # stable: file order on ties
+
+    def compose(self, query, live, budget):
+        ''' the content of the user message for query
+            live     the messages that will still be sent with it
+            budget   tokens for new chunks (0 for no limit)
+            returns (content, chunks sent, messages referred to) '''
+        live = {id(m) for m in live}
+        chunks = self.chunks()
+        fresh = [c for c in chunks if id(self.sent.get(c.hash)) not in live]
+        if budget and sum(c.tokens for c in fresh) > budget:
+            picked, used = set(), 0
+            for c in self.rank(query, chunks):
+                if id(self.sent.get(c.hash)) in live:
+                    picked.add(c.hash)  # costs nothing, it is there already
+                elif used + c.tokens <= budget:
+                    picked.add(c.hash)
+                    used += c.tokens
+            chunks = [c for c in chunks if c.hash in picked]
+        parts, sent, refs, seen = [], [], [], []
+        for c in chunks:
+            message = self.sent.get(c.hash)
+            if id(message) in live:
+                seen.append(c.label())
+                refs.append(message)
+            else:
+                parts.append(f"[[{c.label()}]]\n```\n{c.text.rstrip()}\n```")
+                sent.append(c)
+        content = query
+        if parts:
+            content += "\n\nAttached files:\n" + "\n\n".join(parts)
+        if seen:
+            content += ("\n\nAlso relevant, unchanged and sent earlier in this "
+                        "conversation: " + ", ".join(seen))
+        return content, sent, refs
+
+    def mark_sent(self, message, chunks):
+        for c in chunks:
+            self.sent[c.hash] = message
@@ -0,0 +1,204 @@
+# batch.py
+# Headless batch mode: run a file of prompts without the GUI.
+#   python wxAIchat.py --batch prompts.jsonl -o results.jsonl
+# Prompts come from a JSONL file ({"id": ..., "prompt": ...}, an
+# optional "model" and "role") or a text file (one prompt per line).
+# They run on a few worker threads inside the rpm/tpm limits, failed
+# requests are retried, and each result is appended to the output as
+# soon as it is in. Running the same command again skips the prompts
+# that already have a reply, so an interrupted run resumes.
+#
+
+import json
+import os
+import queue
+import sys
+import threading
+from time import perf_counter, time
+
+import chatlog
+import context
+import pricing
+import retry
+
+STOP_WAIT = 5.0  # seconds given to requests in flight after Ctrl-C
+
+
+def read_prompts(path):
+    ''' yield (id, prompt, model, role), model and role may be None '''
+    jsonl = path.endswith(".jsonl")
+    with open(path, encoding="utf-8") as fin:
+        for n, line in enumerate(fin, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if not jsonl:
+                yield str(n), line, None, None
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                print(f"{path}:{n}: not JSON, skipped", file=sys.stderr)
+                continue
+            if isinstance(item, str):
+                item = {"prompt": item}
+            prompt = item.get("prompt") or item.get("content")
+            if not prompt:
+                print(f"{path}:{n}: no prompt, skipped", file=sys.stderr)
+                continue
+            yield (str(item.get("id", n)), prompt,
+                   item.get("model"), item.get("role"))
+
+
+def done_ids(out_path):
+    ''' ids that already have a reply in the output file '''
+    done = set()
+    if not os.path.isfile(out_path):
+        return done
+    with open(out_path, encoding="utf-8") as fin:
+        for line in fin:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # a torn last line
+            if "reply" in rec:
+                done.add(str(rec["id"]))
+    return done
+
+
+class BatchRunner:
+    ''' request(key, model, messages, job) -> reply text '''
+
+    def __init__(self, request, key, model, role, out_path, workers=4,
+                 limiter=None, retries=3, log=None):
+        self.request = request
+        self.key = key
+        self.model = model
+        self.role = role
+        self.out_path = out_path
+        self.workers = max(1, workers)
+        self.limiter = limiter
+        self.retries = retries
+        self.log = log          # chatlog.ChatLog or None
+        self.session = None     # log session of this run
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue(maxsize=self.workers * 2)
+        self.out = None
+        self.ok = self.failed = 0
+
+    def run(self, prompts):
+        ''' run all prompts not done yet, returns (ok, failed, skipped) '''
+        done = done_ids(self.out_path)
+        skipped = 0
+        self.out = open(self.out_path, "a", encoding="utf-8")
+        threads = [threading.Thread(target=self._loop, daemon=True)
+                   for _ in range(self.workers)]
+        for t in threads:
+            t.start()
+        started = perf_counter()
+        try:
+            for item in prompts:
+                if item[0] in done:
+                    skipped += 1
+                    continue
+                while not self.stop.is_set():
+                    try:
+                        self.jobs.put(item, timeout=0.5)
+                        break
+                    except queue.Full:
+                        pass
+                if self.stop.is_set():
+                    break
+            for _ in threads:
+                self.jobs.put(None)
+            while any(t.is_alive() for t in threads):
+                for t in threads:
+                    t.join(0.5)
+        except KeyboardInterrupt:
+            self.stop.set()
+            print("\nInterrupted, run again to resume", file=sys.stderr)
+            # replies already on their way are still written, for a while
+            deadline = perf_counter() + STOP_WAIT
+            for t in threads:
+                t.join(max(0.0, deadline - perf_counter()))
+        finally:
+            with self.lock:
+                self.out.flush()
+                os.fsync(self.out.fileno())
+                self.out.close()
+        print(f"{self.ok} done, {self.failed} failed, {skipped} skipped "
+              f"in {perf_counter() - started:.1f}s", file=sys.stderr)
+        return self.ok, self.failed, skipped
+
+    def _loop(self):
+        while not self.stop.is_set():
+            item = self.jobs.get()
+            if item is None:
+                return
+            self._write(self._one(*item))
+
+    def _one(self, pid, prompt, model, role):
+        ''' one prompt, with retries; returns the output record '''
+        model = model or self.model
+        role = role or self.role
+        messages = [{"role": "system", "content": role},
+                    {"role": "user", "content": prompt}]
+        estimate = sum(context.count_tokens(m["content"]) + context.MSG_OVERHEAD
+                       for m in messages)
+        rec = {"id": pid, "model": model, "prompt": prompt}
+        t0 = perf_counter()
+        job = retry.Attempt()
+        attempts = []
+
+        def once():
+            attempts.append(perf_counter())
+            return self.request(self.key, model, messages, job)
+
+        try:
+            reply = retry.call(once, self.retries, estimate, self.limiter, self.stop)
+        except Exception as e:
+            rec["error"] = f"{type(e).__name__}: {e}"
+        else:
+            if reply is None:
+                rec["error"] = "stopped"
+            else:
+                rec["reply"] = reply
+                if job.usage is not None:
+                    rec["usage"] = dict(zip(("prompt", "cached", "completion"),
+                                            pricing.usage_counts(job.usage)))
+                    if self.limiter is not None:
+                        self.limiter.adjust(job.usage.total_tokens - estimate)
+                self._log(role, prompt, reply, model)
+        rec["attempts"] = len(attempts)
+        rec["seconds"] = round(perf_counter() - t0, 3)
+        rec["ts"] = time()
+        return rec
+
+    def _write(self, rec):
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.out.closed:
+                return  # past STOP_WAIT, the prompt is run again on resume
+            self.out.write(line)
+            self.out.flush()
+            if "reply" in rec:
+                self.ok += 1
+            else:
+                self.failed += 1
+            n = self.ok + self.failed
+        state = "ok" if "reply" in rec else rec["error"]
+        print(f"[{n}] {rec['id']}: {state}", file=sys.stderr)
+
+    def _log(self, role, prompt, reply, model):
+        ''' each exchange goes to log.jsonl, like a turn in the GUI '''
+        if self.log is None:
+            return
+        with self.lock:
+            records = []
+            if self.session is None:
+                self.session = chatlog.new_session_id()
+                records.append(chatlog.record(self.session, "system", role))
+            records.append(chatlog.record(self.session, "user", prompt))
+            records.append(chatlog.record(self.session, "assistant", reply, model))
+            self.log.write(*records)
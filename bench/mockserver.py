@@ -0,0 +1,175 @@
+# bench/mockserver.py
+# A local stand-in for the OpenAI API, for benchmarks and CI runs
+# without a key or network. Implements
+#   POST /v1/chat/completions   plain and streamed (SSE), with usage
+#   POST /v1/audio/speech       a payload of --audio-bytes
+#   GET  /v1/models
+# Replies wait --latency seconds, then send --reply-tokens tokens at
+# --token-rate tokens per second. Point the app at it with
+#   OPENAI_BASE_URL=http://127.0.0.1:PORT/v1 OPENAI_API_KEY=mock
+#
+#   python bench/mockserver.py [--port 8000] [--latency 0.2] [--token-rate 200]
+#
+# Prints "listening on <base url>" once it takes requests.
+#
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("the quick brown fox jumps over a lazy dog while "
+         "python code runs in a background thread").split()
+CODE = "\n```python\nfor i in range(10):\n    print(i)\n```\n"
+
+
+class Config:
+    latency = 0.2        # seconds before the first byte
+    token_rate = 200.0   # tokens per second, 0 sends all at once
+    reply_tokens = 200   # tokens in each reply
+    audio_bytes = 48000  # size of a speech reply (1 s of 24 kHz PCM)
+    fail_rate = 0.0      # part of the requests answered with a 429
+    retry_after = 1.0    # seconds sent with a 429
+
+
+def reply_tokens(n):
+    ''' n "tokens" of text with a code block, as a list of deltas '''
+    out = []
+    for i in range(n):
+        if i and i % 60 == 0:
+            out.append(CODE)
+        else:
+            out.append(WORDS[i % len(WORDS)] + ("\n" if i % 15 == 14 else " "))
+    return out
+
+
+def prompt_tokens(messages):
+    ''' about 4 characters to a token '''
+    return sum(len(m.get("content") or "") for m in messages) // 4 + 3 * len(messages)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    config = Config
+
+    def log_message(self, format, *args):
+        pass  # quiet
+
+    def send_json(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(n) or b"{}")
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [
+                {"id": "mock", "object": "model", "created": 0, "owned_by": "bench"}]})
+        else:
+            self.send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = self.read_body()
+        cfg = self.config
+        if cfg.fail_rate and random.random() < cfg.fail_rate:
+            self.send_json(429, {"error": {"message": "rate limited (mock)",
+                                           "type": "rate_limit_error"}},
+                           [("Retry-After", str(cfg.retry_after))])
+            return
+        time.sleep(cfg.latency)
+        if self.path.endswith("/chat/completions"):
+            self.chat(body, cfg)
+        elif self.path.endswith("/audio/speech"):
+            data = bytes(cfg.audio_bytes)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_json(404, {"error": {"message": "not found"}})
+
+    def chat(self, body, cfg):
+        model = body.get("model", "mock")
+        tokens = reply_tokens(cfg.reply_tokens)
+        usage = {"prompt_tokens": prompt_tokens(body.get("messages", [])),
+                 "completion_tokens": len(tokens),
+                 "prompt_tokens_details": {"cached_tokens": 0}}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": "chatcmpl-mock", "created": int(time.time()), "model": model}
+        delay = 1.0 / cfg.token_rate if cfg.token_rate else 0.0
+
+        if not body.get("stream"):
+            time.sleep(delay * len(tokens))
+            self.send_json(200, dict(base, object="chat.completion", usage=usage, choices=[
+                {"index": 0, "finish_reason": "stop",
+                 "message": {"role": "assistant", "content": "".join(tokens)}}]))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk = dict(base, object="chat.completion.chunk")
+        try:
+            self.event(dict(chunk, choices=[{"index": 0, "delta": {"role": "assistant"}}]))
+            for t in tokens:
+                if delay:
+                    time.sleep(delay)
+                self.event(dict(chunk, choices=[{"index": 0, "delta": {"content": t}}]))
+            self.event(dict(chunk, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self.event(dict(chunk, choices=[], usage=usage))
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client stopped the stream
+
+    def event(self, obj):
+        self.write_chunk(b"data: " + json.dumps(obj).encode() + b"\n\n")
+
+    def write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+def start(port=0, **config):
+    ''' run a server on a background thread, returns (server, base_url) '''
+    cfg = type("Config", (Config,), config)
+    handler = type("Handler", (Handler,), {"config": cfg})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local mock of the OpenAI API")
+    ap.add_argument("--port", type=int, default=8000, help="0 picks a free port")
+    ap.add_argument("--latency", type=float, default=Config.latency)
+    ap.add_argument("--token-rate", type=float, default=Config.token_rate)
+    ap.add_argument("--reply-tokens", type=int, default=Config.reply_tokens)
+    ap.add_argument("--audio-bytes", type=int, default=Config.audio_bytes)
+    ap.add_argument("--fail-rate", type=float, default=Config.fail_rate)
+    ap.add_argument("--retry-after", type=float, default=Config.retry_after)
+    args = vars(ap.parse_args())
+    server, url = start(**args)
+    print("listening on", url, flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+# bench/run.py
+# Benchmark suite for wxAIchat, offline: the API is played by
+# bench/mockserver.py on localhost, everything else runs in a temp
+# directory with its own options.ini, log and caches.
+#
+#   python bench/run.py [--size ci|full] [--only log,search] [--json out.json]
+#
+# scenarios
+#   log      ChatLog writes of a long conversation, then a big log.jsonl
+#            paged by logview (what "View Log" does)
+#   search   TextSearch over a large response (what Ctrl-F / Ctrl-N do)
+#   context  planning each turn of a long conversation
+#   chat     gptCode and gptStream against the mock server, one at a
+#            time and concurrently                (needs openai, wx)
+#   tts      openvoc.cached_audio, cold and warm: all of textospeech
+#            but starting the player              (needs openai)
+#   gui      on_submit, on_view and findNext on a real frame
+#                                                 (needs wx and a display)
+# Each scenario reports throughput, latency percentiles and the peak
+# RSS of the process. --size full uses 1,000-turn conversations and a
+# 100 MB log. Scenarios whose modules are missing are skipped.
+#
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from time import perf_counter, sleep
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import chatlog
+import context
+import metrics
+
+SIZES = {
+    "ci":   {"turns": 100, "log_mb": 5, "text_mb": 1, "requests": 40, "workers": 4},
+    "full": {"turns": 1000, "log_mb": 100, "text_mb": 10, "requests": 200, "workers": 8},
+}
+
+# options.ini of the temp directory
+OPTIONS = {
+    "openai": "WXAI_BENCH_KEY", "model": "gpt-4.1-mini", "log": "on",
+    "stream": "on", "warmup": "off", "cache": "off", "metrics": "off",
+    "max_context": "0", "context": "off", "pool_size": "8",
+}
+
+
+class Skip(Exception):
+    ''' a scenario that cannot run here '''
+
+
+class BenchJob:
+    ''' what gptCode / gptStream need from a reqworker.Job '''
+    def __init__(self):
+        self.started = perf_counter()
+        self.ttft = None
+        self.usage = None
+
+    def is_cancelled(self):
+        return False
+
+    def emit(self, delta):
+        if self.ttft is None:
+            self.ttft = perf_counter() - self.started
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def result(name, latencies, seconds=None, unit="op", extra=None):
+    ''' one result line: count, throughput, percentiles and peak memory '''
+    seconds = sum(latencies) if seconds is None else seconds
+    res = {"name": name, "n": len(latencies), "seconds": seconds,
+           "throughput": len(latencies) / seconds if seconds else 0.0, "unit": unit,
+           "p50": metrics.percentile(latencies, 50),
+           "p95": metrics.percentile(latencies, 95),
+           "p99": metrics.percentile(latencies, 99),
+           "peak_rss_mb": peak_rss_mb()}
+    res.update(extra or {})
+    return res
+
+
+def timed(func, *args):
+    t0 = perf_counter()
+    out = func(*args)
+    return perf_counter() - t0, out
+
+
+def conversation(turns):
+    ''' a role and turns exchanges of realistic length '''
+    conv = [{"role": "system", "content": "you are a helpful assistant."}]
+    for i in range(turns):
+        conv.append({"role": "user", "content": f"Question {i}: how do I sort a list "
+                     "of tuples by the second item and keep it stable? " * 2})
+        conv.append({"role": "assistant", "content": ("Use sorted(items, key=lambda t: t[1]). "
+                     "Python's sort is stable, equal keys keep their order.\n" * 8)
+                     + "```python\nsorted(items, key=lambda t: t[1])\n```\n"})
+    return conv
+
+
+def make_log(path, mb):
+    ''' a log.jsonl of about mb MB: sessions of 20 exchanges '''
+    target = mb * 1_000_000
+    conv = conversation(20)
+    size = 0
+    with open(path, "w", encoding="utf-8") as fout:
+        while size < target:
+            session = chatlog.new_session_id()
+            lines = "".join(json.dumps(chatlog.record(session, m["role"], m["content"],
+                                                      "gpt-4.1-mini"), ensure_ascii=False) + "\n"
+                            for m in conv)
+            fout.write(lines)
+            size += len(lines)
+    return size
+
+
+# ----------------------------
+#   Scenarios
+# ----------------------------
+
+def bench_log(size, work):
+    out = []
+    conv = conversation(size["turns"])
+    log = chatlog.ChatLog(os.path.join(work, "write.jsonl"))
+    session = chatlog.new_session_id()
+    lat = []
+    t0 = perf_counter()
+    for i in range(1, len(conv), 2):
+        t, _ = timed(log.write, chatlog.record(session, "user", conv[i]["content"]),
+                     chatlog.record(session, "assistant", conv[i + 1]["content"], "mock"))
+        lat.append(t)
+    log.close(timeout=120)
+    out.append(result("log write (enqueue per turn)", lat, perf_counter() - t0, "turn"))
+
+    import logview
+    path = os.path.join(work, chatlog.LOG_FILE)
+    t, written = timed(make_log, path, size["log_mb"])
+    out.append(result(f"log build {size['log_mb']} MB", [t], unit="log",
+                      extra={"mb_per_s": written / 1e6 / t}))
+    lat = []
+    t, pager = timed(logview.LogPager, path)
+    lat.append(t)
+    pages = []
+    while not pager.at_start() and len(pages) < 50:
+        t, _ = timed(pager.earlier, 5)
+        pages.append(t)
+    pager.close()
+    out.append(result("log view open", lat, unit="open"))
+    out.append(result("log view page (5 sessions)", pages, unit="page"))
+    t, _ = timed(chatlog.export_markdown, path, os.path.join(work, "log.md"))
+    out.append(result(f"log export {size['log_mb']} MB", [t], unit="export",
+                      extra={"mb_per_s": size["log_mb"] / t}))
+    return out
+
+
+def bench_search(size, work):
+    import textsearch
+    conv = conversation(size["turns"])
+    text = "".join(m["content"] for m in conv)
+    text = (text * (size["text_mb"] * 1_000_000 // len(text) + 1))[:size["text_mb"] * 1_000_000]
+    search = textsearch.TextSearch()
+    out = []
+    for label, kw in (("plain", {}), ("regex", {"regex": True}),
+                      ("word+case", {"whole_word": True, "case": True})):
+        query = r"sort(ed)?\b" if kw.get("regex") else "sorted"
+        search.set_text(text)
+        search.set_query(query, **kw)
+        t, found = timed(search.matches)
+        steps = []
+        for _ in range(1000):
+            ts, _ = timed(search.step, 0)
+            steps.append(ts)
+        out.append(result(f"search {label} {size['text_mb']} MB", [t], unit="scan",
+                          extra={"matches": len(found)}))
+        out.append(result(f"search {label} next", steps, unit="step"))
+    return out
+
+
+def bench_context(size, work):
+    conv = conversation(size["turns"])
+    out = []
+    for strategy, budget in (("window", 16000), ("off", 0)):
+        manager = context.ContextManager(budget, strategy)
+        lat = []
+        for n in range(2, len(conv) + 1, 2):
+            t, _ = timed(manager.plan, conv[:n])
+            lat.append(t)
+        out.append(result(f"context plan {strategy} ({size['turns']} turns)", lat, unit="turn"))
+    return out
+
+
+def need(*modules):
+    for name in modules:
+        try:
+            __import__(name)
+        except ImportError as e:
+            raise Skip(str(e))
+
+
+def bench_chat(size, work):
+    need("openai", "wx")
+    import aiclient
+    import wxAIchat
+    aiclient.configure(OPTIONS["openai"], size["workers"], 60)
+    messages = context.messages(context.ContextManager().plan(conversation(10)))
+    model = OPTIONS["model"]
+    out = []
+
+    def one(func):
+        job = BenchJob()
+        func(OPTIONS["openai"], model, messages, job)
+        return perf_counter() - job.started, job
+
+    one(wxAIchat.gptCode)  # opens the connection
+    lat = [one(wxAIchat.gptCode)[0] for _ in range(size["requests"] // 4)]
+    out.append(result("gptCode sequential", lat, unit="req"))
+    runs = [one(wxAIchat.gptStream) for _ in range(size["requests"] // 4)]
+    out.append(result("gptStream sequential", [r[0] for r in runs], unit="req",
+                      extra={"ttft_p50": metrics.percentile([r[1].ttft for r in runs], 50)}))
+
+    lat = []
+    lock = threading.Lock()
+    todo = list(range(size["requests"]))
+
+    def worker():
+        while True:
+            with lock:
+                if not todo:
+                    return
+                todo.pop()
+            t, _ = one(wxAIchat.gptCode)
+            with lock:
+                lat.append(t)
+
+    threads = [threading.Thread(target=worker) for _ in range(size["workers"])]
+    t0 = perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    out.append(result(f"gptCode x{size['workers']} concurrent", lat,
+                      perf_counter() - t0, "req"))
+    return out
+
+
+def bench_tts(size, work):
+    need("openai")
+    import openvoc
+    openvoc.CACHE_DIR = os.path.join(work, "audiocache")
+    texts = [f"Sentence number {i} of the reply, spoken aloud." for i in range(size["requests"])]
+    cold = [timed(openvoc.cached_audio, "alloy", t, "pcm")[0] for t in texts]
+    warm = [timed(openvoc.cached_audio, "alloy", t, "pcm")[0] for t in texts]
+    return [result("tts cold (synthesize + cache)", cold, unit="req"),
+            result("tts warm (cache hit)", warm, unit="req")]
+
+
+def bench_gui(size, work):
+    need("wx", "openai")
+    import wx
+    if sys.platform.startswith("linux") and not (os.environ.get("DISPLAY")
+                                                 or os.environ.get("WAYLAND_DISPLAY")):
+        raise Skip("no display (use xvfb-run)")
+    import wxAIchat
+    app = wx.App(False)
+    frame = wxAIchat.MyFrame(None)
+    frame.playback = False
+    out = []
+
+    def pump(until, timeout=60):
+        end = perf_counter() + timeout
+        while not until() and perf_counter() < end:
+            app.Yield(True)
+            sleep(0.001)
+
+    # submit on top of a long conversation
+    pump(lambda: frame.named_session is not None)  # after_show opened a session
+    frame.conversation.extend(conversation(size["turns"])[1:])
+    shown, done = [], []
+    for i in range(size["requests"] // 4):
+        frame.text1.SetValue(f"Bench prompt {i}")
+        t0 = perf_counter()
+        frame.on_submit(None)
+        job = frame.chat_job
+        pump(lambda: job.shown or frame.chat_job is None)
+        shown.append(perf_counter() - t0)
+        pump(lambda: frame.chat_job is None)
+        done.append(perf_counter() - t0)
+    out.append(result(f"on_submit to first text ({size['turns']} turns)", shown, unit="req"))
+    out.append(result(f"on_submit to finished ({size['turns']} turns)", done, unit="req"))
+
+    # the big log, as View Log shows it
+    make_log(chatlog.LOG_FILE, size["log_mb"])
+    lat = [timed(frame.on_view, None)[0] for _ in range(5)]
+    out.append(result(f"on_view {size['log_mb']} MB log", lat, unit="view"))
+    pages = []
+    while not frame.pager.at_start() and len(pages) < 20:
+        pages.append(timed(frame.view_earlier)[0])
+    out.append(result("view_earlier", pages, unit="page"))
+
+    frame.search.set_query("sorted")
+    frame.text2.SetInsertionPoint(0)
+    lat = [timed(frame.findNext)[0] for _ in range(200)]
+    out.append(result("findNext in the log view", lat, unit="step"))
+
+    frame.options_timer.Stop()
+    frame.worker.shutdown()
+    frame.voice_worker.shutdown()
+    if frame.chatlog is not None:
+        frame.chatlog.close()
+    frame.Destroy()
+    return out
+
+
+SCENARIOS = {"log": bench_log, "search": bench_search, "context": bench_context,
+             "chat": bench_chat, "tts": bench_tts, "gui": bench_gui}
+
+
+# ----------------------------
+#   Setup and report
+# ----------------------------
+
+def start_server(args):
+    ''' the mock API in its own process, so it does not share our GIL '''
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "bench", "mockserver.py"), "--port", "0",
+         "--latency", str(args.latency), "--token-rate", str(args.token_rate),
+         "--reply-tokens", str(args.reply_tokens), "--audio-bytes", str(args.audio_bytes)],
+        stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    if not line.startswith("listening on"):
+        proc.kill()
+        raise RuntimeError("mock server did not start")
+    return proc, line.split()[-1]
+
+
+def write_options(work):
+    ''' the repo's options.ini with the bench settings '''
+    lines = []
+    with open(os.path.join(ROOT, "options.ini"), encoding="utf-8") as fin:
+        for line in fin:
+            key = line.split("=", 1)[0].strip()
+            if "=" in line and key in OPTIONS:
+                line = f"{key}={OPTIONS[key]}\n"
+            lines.append(line)
+    with open(os.path.join(work, "options.ini"), "w", encoding="utf-8") as fout:
+        fout.writelines(lines)
+
+
+def show(res):
+    line = f"{res['name']:42} n={res['n']:<5} {res['throughput']:10.1f} {res['unit']}/s"
+    if res["n"] > 1:
+        line += (f"   p50 {res['p50'] * 1000:9.3f}ms   p95 {res['p95'] * 1000:9.3f}ms"
+                 f"   p99 {res['p99'] * 1000:9.3f}ms")
+    else:
+        line += f"   {res['seconds']:.3f}s"
+    print(line + f"   peak {res['peak_rss_mb']:.0f} MB", flush=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="wxAIchat benchmarks against a local mock API")
+    ap.add_argument("--size", choices=sorted(SIZES), default="ci")
+    ap.add_argument("--only", default="", help="comma separated scenarios: " + ",".join(SCENARIOS))
+    ap.add_argument("--json", help="also write the results to this file")
+    ap.add_argument("--latency", type=float, default=0.05, help="mock server seconds to first byte")
+    ap.add_argument("--token-rate", type=float, default=2000, help="mock server tokens per second")
+    ap.add_argument("--reply-tokens", type=int, default=200)
+    ap.add_argument("--audio-bytes", type=int, default=48000)
+    ap.add_argument("--keep", action="store_true", help="keep the temp directory")
+    args = ap.parse_args()
+    size = SIZES[args.size]
+    names = [n for n in args.only.split(",") if n] or list(SCENARIOS)
+
+    work = tempfile.mkdtemp(prefix="wxaichat-bench-")
+    server, url = start_server(args)
+    os.environ.update(OPENAI_BASE_URL=url, WXAI_BENCH_KEY="mock", OPENAI_API_KEY="mock")
+    write_options(work)
+    os.chdir(work)  # the app reads options.ini and writes its files here
+    results, failed = [], False
+    try:
+        for name in names:
+            print(f"--- {name}", flush=True)
+            try:
+                for res in SCENARIOS[name](size, work):
+                    res["scenario"] = name
+                    results.append(res)
+                    show(res)
+            except Skip as e:
+                print(f"skipped: {e}")
+            except Exception as e:
+                print(f"FAILED: {type(e).__name__}: {e}")
+                failed = True
+    finally:
+        server.kill()
+        os.chdir(ROOT)
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+        else:
+            print("files kept in", work)
+    if args.json:
+        with open(args.json, "w") as fout:
+            json.dump({"size": args.size, "results": results}, fout, indent=1)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
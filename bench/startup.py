@@ -0,0 +1,73 @@
+# bench/startup.py
+# Startup benchmark for wxAIchat.
+# Starts the app several times with WXAICHAT_STARTUP_BENCH=1: the app
+# reports how long its imports took and when the frame was shown,
+# then quits. Prints the median and worst of each and fails if a
+# limit is passed or a heavy module got imported before the window.
+#
+#   python bench/startup.py [--runs 5] [--max-shown 1.5] [--max-imports 0.8]
+#
+# Needs a display (use xvfb-run on a headless machine).
+#
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# must not be loaded before the window is shown
+HEAVY = ["openai", "httpx", "markdown", "webbrowser", "tiktoken"]
+
+
+def one_run():
+    env = dict(os.environ, WXAICHAT_STARTUP_BENCH="1")
+    t0 = perf_counter()
+    out = subprocess.run([sys.executable, "wxAIchat.py"], cwd=ROOT, env=env,
+                         capture_output=True, text=True, timeout=60)
+    wall = perf_counter() - t0
+    for line in out.stdout.splitlines():
+        if line.startswith("{"):
+            data = json.loads(line)
+            data["wall"] = wall
+            return data
+    raise RuntimeError("no timings reported:\n" + out.stderr)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--max-shown", type=float, default=0.0,
+                    help="fail if the median seconds to the shown frame is above this")
+    ap.add_argument("--max-imports", type=float, default=0.0,
+                    help="fail if the median import seconds is above this")
+    args = ap.parse_args()
+
+    runs = [one_run() for _ in range(args.runs)]
+    failed = False
+    for key in ("imports", "shown", "wall"):
+        values = [r[key] for r in runs]
+        print(f"{key:8} median {statistics.median(values):.3f}s"
+              f"   max {max(values):.3f}s")
+    eager = sorted({m.split(".")[0] for r in runs for m in r["modules"]}
+                   & set(HEAVY))
+    if eager:
+        print("imported before the window was shown:", ", ".join(eager))
+        failed = True
+    shown = statistics.median(r["shown"] for r in runs)
+    imports = statistics.median(r["imports"] for r in runs)
+    if args.max_shown and shown > args.max_shown:
+        print(f"frame shown after {shown:.3f}s, limit {args.max_shown}s")
+        failed = True
+    if args.max_imports and imports > args.max_imports:
+        print(f"imports took {imports:.3f}s, limit {args.max_imports}s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# chatlog.py
+# Append-only chat log: one JSON record per message in log.jsonl.
+# Only the new messages of a turn are written, by a background
+# thread that batches them and fsyncs, so the GUI never waits.
+# log.md is no longer written. The chats of an existing log.md are
+# imported into log.jsonl once, in front of the newer records, and
+# log.md itself is left alone. export_markdown() writes the whole
+# JSONL store to log.export.md when it is wanted.
+#
+
+import json
+import os
+import queue
+import re
+import shutil
+import threading
+import uuid
+from time import localtime, mktime, strftime, strptime, time
+
+LOG_FILE = "log.jsonl"
+MD_FILE = "log.export.md"
+OLD_MD_FILE = "log.md"  # written by the versions before log.jsonl
+
+OLD_HEADER = re.compile(r'^=== Chat on (.+) ===$')
+OLD_ROLE = re.compile(r'^(SYSTEM|USER|ASSISTANT):$')
+OLD_END = "=" * 40
+
+
+def new_session_id():
+    return uuid.uuid4().hex[:12]
+
+
+def record(session, role, content, model=""):
+    ''' one log record '''
+    return {"session": session, "ts": time(), "role": role,
+            "model": model, "content": content}
+
+
+class ChatLog:
+    ''' background writer for the JSONL log '''
+
+    def __init__(self, path=LOG_FILE):
+        self.path = path
+        self.jobs = queue.Queue()
+        self.listeners = []  # called on the writer thread after each write
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def write(self, *records):
+        ''' queue records for writing, returns at once '''
+        self.jobs.put(list(records))
+
+    def close(self, timeout=5.0):
+        ''' write what is queued and stop the writer '''
+        self.jobs.put(None)
+        self.thread.join(timeout)
+
+    def sync(self, timeout=5.0):
+        ''' wait until what is queued has been written '''
+        done = threading.Event()
+        self.jobs.put(done)
+        done.wait(timeout)
+
+    def _loop(self):
+        while True:
+            item = self.jobs.get()
+            batch, waiting, stop = [], [], False
+            # take everything already queued in the same write
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiting.append(item)
+                else:
+                    batch.extend(item)
+                try:
+                    item = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._append(batch)
+            for done in waiting:
+                done.set()
+            if stop:
+                return
+
+    def _append(self, batch):
+        lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch)
+        try:
+            with open(self.path, "a", encoding="utf-8") as fout:
+                fout.write(lines)
+                fout.flush()
+                os.fsync(fout.fileno())
+        except OSError as e:
+            print("Log Error:", e)
+            return
+        for listener in self.listeners:
+            try:
+                listener(batch)
+            except Exception as e:
+                print("Log Listener Error:", e)
+
+
+def read_records(path=LOG_FILE):
+    ''' yield the log records one by one '''
+    if not os.path.isfile(path):
+        return
+    with open(path, "r", encoding="utf-8") as fin:
+        for line in fin:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # a torn last line
+
+
+def session_header(rec):
+    day = strftime("%a %d %b %Y %H:%M", localtime(rec["ts"]))
+    return "\n\n=== Chat on %s ===\n\n" % day
+
+
+def format_record(rec):
+    return f"{rec['role'].upper()}:\n{rec['content']}\n\n"
+
+
+def export_markdown(path=LOG_FILE, md_path=MD_FILE):
+    ''' write the whole log as Markdown, one section per session '''
+    session = None
+    with open(md_path, "w", encoding="utf-8") as fout:
+        for rec in read_records(path):
+            if rec["session"] != session:
+                if session is not None:
+                    fout.write("=" * 40 + "\n\n")
+                session = rec["session"]
+                fout.write(session_header(rec))
+            fout.write(format_record(rec))
+        if session is not None:
+            fout.write("=" * 40 + "\n\n")
+    return md_path
+
+
+def parse_old_log(md_path=OLD_MD_FILE):
+    ''' the chats of an old log.md as log records
+        each old section held the whole conversation so far, so a
+        section that goes on from the one before adds only its new
+        messages to the same session '''
+    sections = []  # (ts, [(role, content)])
+    ts, messages, role, lines = 0.0, None, None, []
+
+    def close_message():
+        if messages is not None and role is not None:
+            messages.append((role, "\n".join(lines).strip("\n")))
+
+    with open(md_path, "r", encoding="utf-8", errors="replace") as fin:
+        for line in fin:
+            line = line.rstrip("\n")
+            header = OLD_HEADER.match(line)
+            if header or line == OLD_END:
+                close_message()
+                if messages:
+                    sections.append((ts, messages))
+                messages, role, lines = None, None, []
+                if header:
+                    try:
+                        ts = mktime(strptime(header.group(1), "%a %d %b %Y %H:%M"))
+                    except ValueError:
+                        pass  # another locale, keep the time before
+                    messages = []
+                continue
+            m = OLD_ROLE.match(line)
+            if m and messages is not None:
+                close_message()
+                role, lines = m.group(1).lower(), []
+            elif role is not None:
+                lines.append(line)
+    close_message()
+    if messages:
+        sections.append((ts, messages))
+
+    records, previous, session = [], [], None
+    for ts, messages in sections:
+        if session is None or messages[:len(previous)] != previous:
+            session, new = new_session_id(), messages
+        else:
+            new = messages[len(previous):]
+        for role, content in new:
+            records.append(dict(record(session, role, content), ts=ts, source=OLD_MD_FILE))
+        previous = messages
+    return records
+
+
+def old_log_imported(path=LOG_FILE):
+    ''' the JSONL log starts with the records of an old log.md '''
+    for rec in read_records(path):
+        return rec.get("source") == OLD_MD_FILE
+    return False
+
+
+def import_old_log(md_path=OLD_MD_FILE, path=LOG_FILE):
+    ''' put the chats of an old log.md in front of the JSONL log,
+        once; call before a ChatLog writes to path
+        returns the number of records imported '''
+    if not os.path.isfile(md_path) or old_log_imported(path):
+        return 0
+    records = parse_old_log(md_path)
+    if not records:
+        return 0
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fout:
+        for rec in records:
+            fout.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as fin:
+                shutil.copyfileobj(fin, fout)
+        fout.flush()
+        os.fsync(fout.fileno())
+    os.replace(tmp, path)
+    return len(records)
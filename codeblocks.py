@@ -0,0 +1,134 @@
+# codeblocks.py
+# Index of the fenced code blocks in a response.
+# Text is fed as it arrives (streamed or whole), each line is looked
+# at once, so the index is ready without rescanning the response.
+# Handles ``` and ~~~ fences, indented fences (in lists) and
+# language tags like "```python", "``` python" or "```{.python}".
+#
+
+import re
+
+FENCE = re.compile(r'^([ \t]*)(`{3,}|~{3,})(.*)$')
+
+EXTENSIONS = {
+    "python": "py", "py": "py", "javascript": "js", "js": "js",
+    "typescript": "ts", "ts": "ts", "bash": "sh", "sh": "sh", "shell": "sh",
+    "c": "c", "cpp": "cpp", "c++": "cpp", "java": "java", "go": "go",
+    "rust": "rs", "html": "html", "css": "css", "json": "json",
+    "yaml": "yaml", "sql": "sql", "markdown": "md", "md": "md",
+}
+
+
+class CodeBlock:
+    def __init__(self, lang, indent, start, first_line):
+        self.lang = lang
+        self.indent = indent      # width of the fence indent
+        self.start = start        # offset of the first code character
+        self.end = start          # offset just after the last code character
+        self.first_line = first_line
+        self.last_line = first_line - 1
+        self.lines = []
+        self.closed = False
+
+    def text(self):
+        ''' the code, without the fence indent '''
+        out = []
+        for line in self.lines:
+            n = 0
+            while n < self.indent and n < len(line) and line[n] in " \t":
+                n += 1
+            out.append(line[n:])
+        return "\n".join(out)
+
+    def extension(self):
+        return EXTENSIONS.get(self.lang.lower(), "txt")
+
+    def describe(self):
+        lang = self.lang or "text"
+        return f"{lang}, lines {self.first_line}-{self.last_line}"
+
+
+def info_lang(info):
+    ''' the language from a fence info string '''
+    info = info.strip().strip("{}").strip()
+    if not info:
+        return ""
+    word = info.split()[0].lstrip(".")
+    return word.split(",")[0]
+
+
+class CodeIndex:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.blocks = []
+        self.partial = ""   # last line, not complete yet
+        self.offset = 0     # offset where partial starts
+        self.line = 1       # line number of partial
+        self.fence = None   # (char, length) of the open fence
+        self.current = -1   # block last copied, for cycling
+
+    def feed(self, text):
+        ''' add text to the end of the indexed response '''
+        data = self.partial + text
+        start = 0
+        while True:
+            nl = data.find("\n", start)
+            if nl == -1:
+                break
+            self._line(data[start:nl], self.offset + start, self.offset + nl)
+            start = nl + 1
+        self.offset += start
+        self.partial = data[start:]
+
+    def finish(self):
+        ''' the text is complete: take the last line too '''
+        if self.partial:
+            self._line(self.partial, self.offset, self.offset + len(self.partial))
+            self.offset += len(self.partial)
+            self.partial = ""
+
+    def parse(self, text):
+        self.reset()
+        self.feed(text)
+        self.finish()
+        return self.blocks
+
+    def _line(self, line, begin, end):
+        ''' one complete line from offset begin to end (before the newline) '''
+        m = FENCE.match(line)
+        if self.fence is None:
+            if m and not (m.group(2)[0] == "`" and "`" in m.group(3)):
+                self.fence = (m.group(2)[0], len(m.group(2)))
+                self.blocks.append(CodeBlock(info_lang(m.group(3)),
+                                             len(m.group(1)), end + 1, self.line + 1))
+        else:
+            block = self.blocks[-1]
+            if (m and m.group(2)[0] == self.fence[0]
+                    and len(m.group(2)) >= self.fence[1] and not m.group(3).strip()):
+                block.closed = True
+                self.fence = None
+            else:
+                block.lines.append(line)
+                block.end = end
+                block.last_line = self.line
+        self.line += 1
+
+    def next(self, backward=False):
+        ''' the block after (or before) the last one copied '''
+        if not self.blocks:
+            return None
+        step = -1 if backward else 1
+        self.current = (self.current + step) % len(self.blocks)
+        return self.blocks[self.current]
+
+    def get(self, n):
+        ''' block n (counting from 1) or None '''
+        if 1 <= n <= len(self.blocks):
+            self.current = n - 1
+            return self.blocks[n - 1]
+        return None
+
+    def all_text(self):
+        return "\n\n".join(b.text() for b in self.blocks)
@@ -0,0 +1,126 @@
+# compare.py
+# Compare mode (Alt-Ctrl-M): the same conversation goes to several
+# models at once through a bounded worker pool. Each reply streams
+# into its own tab with its latency, tokens and cost, and the reply
+# picked with "Keep" goes back into the chat.
+#
+
+from time import perf_counter
+import wx
+
+import metrics
+import reqworker
+
+
+class CompareFrame(wx.Frame):
+    ''' request(job, key, model, messages) runs on the workers
+        on_keep(model, reply) is called with the reply kept
+        metrics (a metrics.Metrics) gets the figures of each reply '''
+
+    def __init__(self, parent, models, key, messages, request, on_keep,
+                 prices, workers=3, metrics=None):
+        super(CompareFrame, self).__init__(parent, title="Compare models",
+                                           size=(700, 600))
+        self.on_keep = on_keep
+        self.prices = prices
+        self.metrics = metrics
+        self.started = perf_counter()
+        self.done = 0
+        self.pages = {}  # job -> (text, label, model)
+
+        panel = wx.Panel(self)
+        self.notebook = wx.Notebook(panel)
+        self.status = wx.StaticText(panel, label="")
+        keep_btn = wx.Button(panel, label="Keep this reply")
+        keep_btn.SetToolTip("Add the reply in this tab to the conversation")
+        close_btn = wx.Button(panel, label="Close")
+        buttons = wx.BoxSizer(wx.HORIZONTAL)
+        buttons.Add(self.status, 1, wx.ALIGN_CENTER_VERTICAL)
+        buttons.Add(keep_btn, 0, wx.LEFT, 5)
+        buttons.Add(close_btn, 0, wx.LEFT, 5)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(self.notebook, 1, wx.EXPAND | wx.ALL, 5)
+        sizer.Add(buttons, 0, wx.EXPAND | wx.ALL, 5)
+        panel.SetSizer(sizer)
+
+        self.executor = reqworker.Executor(self, workers=max(1, min(workers, len(models))))
+        self.Bind(reqworker.EVT_STREAM, self.on_stream)
+        self.Bind(reqworker.EVT_RESULT, self.on_result)
+        keep_btn.Bind(wx.EVT_BUTTON, self.on_keep_reply)
+        close_btn.Bind(wx.EVT_BUTTON, lambda e: self.Close())
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+
+        for model in models:
+            page = wx.Panel(self.notebook)
+            text = wx.TextCtrl(page, style=wx.TE_MULTILINE | wx.TE_READONLY)
+            text.SetFont(parent.text2.GetFont())
+            label = wx.StaticText(page, label="waiting ...")
+            box = wx.BoxSizer(wx.VERTICAL)
+            box.Add(label, 0, wx.ALL, 5)
+            box.Add(text, 1, wx.EXPAND)
+            page.SetSizer(box)
+            self.notebook.AddPage(page, model)
+            job = reqworker.Job("compare", request, key, model, messages)
+            job.reply = ""
+            job.error = None
+            self.pages[job] = (text, label, model)
+            self.executor.submit(job)
+        self.show_status()
+        self.Show()
+
+    def on_stream(self, event):
+        text, label, model = self.pages[event.job]
+        if not event.job.shown:
+            event.job.shown = True
+            label.SetLabel(f"first token {event.job.ttft:.2f}s ...")
+        text.AppendText(event.text)
+
+    def on_result(self, event):
+        job = event.job
+        text, label, model = self.pages[job]
+        self.done += 1
+        if job.is_cancelled():
+            label.SetLabel("stopped")  # the closed stream may raise, keep what came
+        elif event.error is not None:
+            job.error = event.error
+            label.SetLabel(f"failed after {job.total():.2f}s")
+            text.SetValue(str(event.error))
+        else:
+            job.reply = event.result or ""
+            if not job.shown:
+                text.SetValue(job.reply)
+            label.SetLabel(self.describe(job, model))
+        self.show_status()
+
+    def describe(self, job, model):
+        ''' latency, tokens and cost of one reply '''
+        rec = metrics.job_record("compare", job, model, self.prices)
+        if self.metrics is not None:
+            rec = self.metrics.add(rec)
+        parts = []
+        if rec['ttft'] is not None:
+            parts.append(f"first token {rec['ttft']:.2f}s")
+        parts.append(f"total {rec['total']:.2f}s")
+        parts.append(f"tokens {rec['prompt']} in ({rec['cached']} cached, "
+                     f"{metrics.ratio(rec['cached'], rec['prompt']):.0%}) / "
+                     f"{rec['completion']} out")
+        if rec['cost'] is not None:
+            parts.append(f"${rec['cost']:.5f} (saved ${rec['saved']:.5f})")
+        return "   ".join(parts)
+
+    def show_status(self):
+        wall = perf_counter() - self.started
+        self.status.SetLabel(f"{self.done} of {len(self.pages)} done   wall {wall:.2f}s")
+
+    def on_keep_reply(self, event):
+        n = self.notebook.GetSelection()
+        job = list(self.pages)[n]
+        if not job.reply:
+            wx.MessageBox("This model has no reply (yet)", "Compare")
+            return
+        self.on_keep(self.pages[job][2], job.reply)
+        self.Close()
+
+    def on_close(self, event):
+        self.executor.shutdown()
+        self.Destroy()
@@ -0,0 +1,161 @@
+# context.py
+# Keeps the conversation sent to the model inside a token budget.
+# Token counts are worked out once per message and cached, so a
+# turn only tokenizes the new messages, never the whole history.
+#
+# strategies:
+#   window     drop the oldest turns that do not fit
+#   summarize  fold the oldest turns into a running summary
+#   off        send everything
+# the system role (first message) is always kept.
+#
+# The API caches prompt prefixes: a request that starts with the
+# same bytes as a recent one is billed and processed faster for that
+# part. So the cut is made in chunks: when the budget is passed, old
+# turns are dropped until only WINDOW_KEEP of it is used, and the cut
+# then stays put for the next turns, which only add at the end.
+#
+
+_enc = None  # tiktoken encoding, loaded on the first count
+
+MSG_OVERHEAD = 4  # tokens the API adds around each message
+REPLY_PRIMER = 3  # tokens added to prime the reply
+
+WINDOW_KEEP = 0.6  # part of the budget used right after a cut
+
+SUMMARY_ROLE = ("Summarize the conversation below in a few short paragraphs. "
+                "Keep names, facts, decisions and open questions.")
+
+
+def encoder():
+    ''' the tiktoken encoding, or False without tiktoken '''
+    global _enc
+    if _enc is None:
+        try:
+            import tiktoken  # optional, exact counts
+            _enc = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _enc = False
+    return _enc
+
+
+def count_tokens(text):
+    ''' number of tokens in text (estimated without tiktoken) '''
+    enc = encoder()
+    if enc:
+        return len(enc.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+class Plan:
+    ''' what one request will carry '''
+    def __init__(self):
+        self.head = []     # system role
+        self.dropped = []  # old messages outside the budget
+        self.tail = []     # newest messages that fit
+        self.upto = 0      # index in the conversation where tail starts
+        self.tokens = 0    # tokens carried by head + summary + tail
+        self.summary = ""  # summary known so far
+
+
+class ContextManager:
+    def __init__(self, budget=0, strategy="window"):
+        self.budget = budget      # 0 means no limit
+        self.strategy = strategy
+        self.cache = {}           # message content -> tokens
+        self.summary = ""         # summary of conversation[1:summary_upto]
+        self.summary_upto = 1
+        self.window_start = 1     # where the window strategy last cut
+
+    def tokens(self, msg):
+        ''' cached token count of one message '''
+        content = msg["content"]
+        n = self.cache.get(content)
+        if n is None:
+            if len(self.cache) > 4096:
+                self.cache.clear()
+            n = self.cache[content] = count_tokens(content) + MSG_OVERHEAD
+        return n
+
+    def plan(self, conversation, move=True):
+        ''' pick the messages for the next request
+            walks back from the newest message until the budget is used
+            move=False for a request outside the chat (compare, a job):
+            the window cut of the chat is left where it is '''
+        plan = Plan()
+        start = 0
+        if conversation and conversation[0]["role"] == "system":
+            plan.head = [conversation[0]]
+            start = 1
+        used = REPLY_PRIMER + sum(self.tokens(m) for m in plan.head)
+
+        if self.strategy == "summarize":
+            start = max(start, self.summary_upto)
+            plan.summary = self.summary
+            if self.summary:
+                used += count_tokens(self.summary) + MSG_OVERHEAD
+        elif self.strategy == "window":
+            start = max(start, min(self.window_start, len(conversation) - 1))
+
+        fixed = used
+        i = len(conversation)
+        while i > start:
+            used += self.tokens(conversation[i - 1])
+            i -= 1
+        if self.budget and self.strategy != "off" and used > self.budget:
+            # cut well inside the budget, so the next turns keep the prefix
+            keep = fixed + (self.budget - fixed) * WINDOW_KEEP
+            i, used = len(conversation), fixed
+            while i > start:
+                n = self.tokens(conversation[i - 1])
+                if used + n > keep and i < len(conversation):
+                    break  # the newest message is always sent
+                used += n
+                i -= 1
+            # start on a prompt, not on a reply whose prompt was cut
+            while i < len(conversation) - 1 and conversation[i]["role"] != "user":
+                used -= self.tokens(conversation[i])
+                i += 1
+            if self.strategy == "window" and move:
+                self.window_start = i
+        plan.dropped = conversation[start:i]
+        plan.tail = conversation[i:]
+        plan.upto = i
+        plan.tokens = used
+        return plan
+
+    def update_summary(self, summary, upto):
+        ''' keep the summary made on the worker thread '''
+        self.summary = summary
+        self.summary_upto = upto
+
+    def reset(self):
+        self.summary = ""
+        self.summary_upto = 1
+        self.window_start = 1
+
+    def inserted(self, n):
+        ''' n older messages were put in front of conversation[1:] '''
+        if self.window_start > 1:
+            self.window_start += n
+
+
+def summary_request(summary, dropped):
+    ''' messages that ask the model to fold dropped turns into summary '''
+    lines = []
+    if summary:
+        lines.append("Earlier summary:\n" + summary)
+    for msg in dropped:
+        lines.append(f"{msg['role'].upper()}:\n{msg['content']}")
+    return [{"role": "system", "content": SUMMARY_ROLE},
+            {"role": "user", "content": "\n\n".join(lines)}]
+
+
+def messages(plan, summary=None):
+    ''' the message list to send for a plan '''
+    summary = plan.summary if summary is None else summary
+    msgs = list(plan.head)
+    if summary:
+        msgs.append({"role": "system",
+                     "content": "Summary of the earlier conversation:\n" + summary})
+    return msgs + plan.tail
@@ -0,0 +1,168 @@
+# history.py
+# Full-text index of every logged message (SQLite FTS5) so past
+# prompts and responses from all sessions can be searched at once.
+# The index follows log.jsonl: it remembers how far it has read
+# and only indexes records appended since then.
+#
+
+import json
+import os
+import sqlite3
+import threading
+from time import mktime, strptime
+
+import chatlog
+
+DB_FILE = "history.db"
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages(
+    id INTEGER PRIMARY KEY,
+    session TEXT, ts REAL, role TEXT, model TEXT, content TEXT);
+CREATE INDEX IF NOT EXISTS messages_session ON messages(session, id);
+CREATE INDEX IF NOT EXISTS messages_ts ON messages(ts);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='id');
+CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value TEXT);
+'''
+
+
+class Hit:
+    ''' one search result '''
+    def __init__(self, row):
+        (self.id, self.session, self.ts, self.role,
+         self.model, self.snippet, self.rank) = row
+
+
+def fts_query(text):
+    ''' turn typed words into an FTS5 query:
+        every word must match, the last one as a prefix '''
+    words = [w.replace('"', '""') for w in text.split()]
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def day_to_ts(day, end=False):
+    ''' "YYYY-MM-DD" to epoch seconds (start or end of that day) '''
+    ts = mktime(strptime(day, "%Y-%m-%d"))
+    return ts + 86400 if end else ts
+
+
+class HistoryIndex:
+    def __init__(self, db_path=DB_FILE, log_path=chatlog.LOG_FILE):
+        self.db_path = db_path
+        self.log_path = log_path
+        self.local = threading.local()  # one connection per thread
+        self.lock = threading.Lock()
+        self.db().executescript(SCHEMA)
+
+    def db(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def reset(self):
+        ''' forget the index, the next sync reads the log from the start '''
+        with self.lock:
+            conn = self.db()
+            conn.execute("DELETE FROM messages")
+            conn.execute("INSERT INTO messages_fts(messages_fts) VALUES('rebuild')")
+            conn.execute("DELETE FROM meta WHERE key='offset'")
+            conn.commit()
+
+    def sync(self, batch=None):
+        ''' index records appended to the log since the last sync
+            (batch is ignored, so this can be a ChatLog listener) '''
+        if not os.path.isfile(self.log_path):
+            return 0
+        with self.lock:
+            conn = self.db()
+            row = conn.execute("SELECT value FROM meta WHERE key='offset'").fetchone()
+            offset = int(row[0]) if row else 0
+            if offset > os.path.getsize(self.log_path):
+                # the log was replaced, start again
+                conn.execute("DELETE FROM messages")
+                conn.execute("INSERT INTO messages_fts(messages_fts) VALUES('rebuild')")
+                offset = 0
+            added = 0
+            with open(self.log_path, "rb") as fin:
+                fin.seek(offset)
+                for line in fin:
+                    if not line.endswith(b"\n"):
+                        break  # still being written
+                    offset += len(line)
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    cur = conn.execute(
+                        "INSERT INTO messages(session, ts, role, model, content) "
+                        "VALUES(?, ?, ?, ?, ?)",
+                        (rec["session"], rec["ts"], rec["role"],
+                         rec.get("model", ""), rec["content"]))
+                    conn.execute(
+                        "INSERT INTO messages_fts(rowid, content) VALUES(?, ?)",
+                        (cur.lastrowid, rec["content"]))
+                    added += 1
+            conn.execute("INSERT OR REPLACE INTO meta VALUES('offset', ?)",
+                         (str(offset),))
+            conn.commit()
+            return added
+
+    def search(self, text, role=None, model=None, since=None, until=None,
+               limit=100):
+        ''' ranked search, newest first among equal ranks
+            since/until: "YYYY-MM-DD" '''
+        query = fts_query(text)
+        if not query:
+            return []
+        sql = ('SELECT m.id, m.session, m.ts, m.role, m.model, '
+               "snippet(messages_fts, 0, '[', ']', ' ... ', 12), "
+               'bm25(messages_fts) AS rank '
+               'FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid '
+               'WHERE messages_fts MATCH ?')
+        args = [query]
+        if role:
+            sql += ' AND m.role = ?'
+            args.append(role)
+        if model:
+            sql += ' AND m.model = ?'
+            args.append(model)
+        if since:
+            sql += ' AND m.ts >= ?'
+            args.append(day_to_ts(since))
+        if until:
+            sql += ' AND m.ts < ?'
+            args.append(day_to_ts(until, end=True))
+        sql += ' ORDER BY rank, m.ts DESC LIMIT ?'
+        args.append(limit)
+        return [Hit(r) for r in self.db().execute(sql, args)]
+
+    def models(self):
+        rows = self.db().execute(
+            "SELECT DISTINCT model FROM messages WHERE model != '' ORDER BY model")
+        return [r[0] for r in rows]
+
+    def exchange(self, msg_id):
+        ''' the user message and assistant reply around a hit '''
+        conn = self.db()
+        session, role = conn.execute(
+            "SELECT session, role FROM messages WHERE id = ?", (msg_id,)).fetchone()
+        if role == "assistant":
+            user = conn.execute(
+                "SELECT id FROM messages WHERE session = ? AND id < ? "
+                "AND role = 'user' ORDER BY id DESC LIMIT 1",
+                (session, msg_id)).fetchone()
+            first = user[0] if user else msg_id
+        else:
+            first = msg_id
+        rows = conn.execute(
+            "SELECT role, content FROM messages WHERE session = ? AND id >= ? "
+            "AND role != 'system' ORDER BY id LIMIT 2", (session, first))
+        return [{"role": r, "content": c} for r, c in rows]
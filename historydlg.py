@@ -0,0 +1,108 @@
+# historydlg.py
+# Dialog to search the history index (Ctrl-Shift-F)
+#
+
+from time import localtime, strftime
+import wx
+
+ROLES = ["any", "user", "assistant"]
+
+
+class HistoryDialog(wx.Dialog):
+    ''' search past prompts and responses
+        after ShowModal: self.exchange holds the chosen messages
+        and self.reload is True if they go back into the chat '''
+
+    def __init__(self, parent, index):
+        super(HistoryDialog, self).__init__(
+            parent, title="Search History", size=(700, 480),
+            style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+        self.index = index
+        self.hits = []
+        self.exchange = []
+        self.reload = False
+
+        self.query = wx.TextCtrl(self, style=wx.TE_PROCESS_ENTER)
+        self.query.SetToolTip("Words to find (the last one may be partial)")
+        self.role = wx.Choice(self, choices=ROLES)
+        self.role.SetSelection(0)
+        self.model = wx.Choice(self, choices=["any"] + index.models())
+        self.model.SetSelection(0)
+        self.since = wx.TextCtrl(self, size=(100, -1))
+        self.since.SetHint("from YYYY-MM-DD")
+        self.until = wx.TextCtrl(self, size=(100, -1))
+        self.until.SetHint("to YYYY-MM-DD")
+        self.results = wx.ListCtrl(self, style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
+        self.results.InsertColumn(0, "Date", width=130)
+        self.results.InsertColumn(1, "Model", width=100)
+        self.results.InsertColumn(2, "Role", width=80)
+        self.results.InsertColumn(3, "Match", width=370)
+        self.status = wx.StaticText(self, label="")
+
+        show_btn = wx.Button(self, wx.ID_OK, label="Show")
+        show_btn.SetToolTip("Show this exchange in the response area")
+        reload_btn = wx.Button(self, label="Show && Reload")
+        reload_btn.SetToolTip("Also add this exchange to the conversation")
+        cancel_btn = wx.Button(self, wx.ID_CANCEL)
+
+        filters = wx.BoxSizer(wx.HORIZONTAL)
+        filters.Add(self.query, 1, wx.RIGHT, 5)
+        filters.Add(self.role, 0, wx.RIGHT, 5)
+        filters.Add(self.model, 0, wx.RIGHT, 5)
+        filters.Add(self.since, 0, wx.RIGHT, 5)
+        filters.Add(self.until, 0)
+        buttons = wx.BoxSizer(wx.HORIZONTAL)
+        buttons.Add(self.status, 1, wx.ALIGN_CENTER_VERTICAL)
+        buttons.Add(show_btn, 0, wx.LEFT, 5)
+        buttons.Add(reload_btn, 0, wx.LEFT, 5)
+        buttons.Add(cancel_btn, 0, wx.LEFT, 5)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(filters, 0, wx.EXPAND | wx.ALL, 5)
+        sizer.Add(self.results, 1, wx.EXPAND | wx.LEFT | wx.RIGHT, 5)
+        sizer.Add(buttons, 0, wx.EXPAND | wx.ALL, 5)
+        self.SetSizer(sizer)
+
+        self.query.Bind(wx.EVT_TEXT_ENTER, self.on_search)
+        self.since.Bind(wx.EVT_TEXT_ENTER, self.on_search)
+        self.until.Bind(wx.EVT_TEXT_ENTER, self.on_search)
+        self.role.Bind(wx.EVT_CHOICE, self.on_search)
+        self.model.Bind(wx.EVT_CHOICE, self.on_search)
+        self.results.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.on_show)
+        show_btn.Bind(wx.EVT_BUTTON, self.on_show)
+        reload_btn.Bind(wx.EVT_BUTTON, self.on_reload)
+        self.query.SetFocus()
+
+    def on_search(self, event=None):
+        role = self.role.GetStringSelection()
+        model = self.model.GetStringSelection()
+        try:
+            self.hits = self.index.search(
+                self.query.GetValue(),
+                role=None if role == "any" else role,
+                model=None if model == "any" else model,
+                since=self.since.GetValue().strip() or None,
+                until=self.until.GetValue().strip() or None)
+        except ValueError:
+            self.status.SetLabel("Dates are YYYY-MM-DD")
+            return
+        self.results.DeleteAllItems()
+        for n, hit in enumerate(self.hits):
+            self.results.InsertItem(n, strftime("%Y-%m-%d %H:%M", localtime(hit.ts)))
+            self.results.SetItem(n, 1, hit.model)
+            self.results.SetItem(n, 2, hit.role)
+            self.results.SetItem(n, 3, hit.snippet.replace("\n", " "))
+        self.status.SetLabel(f"{len(self.hits)} found")
+        if self.hits:
+            self.results.Select(0)
+
+    def on_show(self, event=None):
+        n = self.results.GetFirstSelected()
+        if n == -1:
+            self.reload = False
+            return
+        self.exchange = self.index.exchange(self.hits[n].id)
+        self.EndModal(wx.ID_OK)
+
+    def on_reload(self, event=None):
+        self.reload = True
+        self.on_show()
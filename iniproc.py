@@ -4,6 +4,8 @@
 # This is my module to read and return ini file key values
 # Keys are case-sensitive
 
+import os
+
 
 def striplist(lst):
     ''' strip items in a list and return list '''
@@ -44,3 +46,83 @@ def read(inifile, *keys):
             rtv.append(0)
 
     return rtv
+
+
+# ----------------------------
+# Typed, cached parse
+# ----------------------------
+
+_cache = {}  # inifile -> ((mtime, size), values)
+
+TRUE = ("on", "true", "yes", "1")
+
+
+def stamp(inifile):
+    ''' (mtime, size) of inifile, to tell when it changed '''
+    st = os.stat(inifile)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def convert(value, default):
+    ''' convert a string value to the type of its default '''
+    if isinstance(default, bool):
+        return value.lower() in TRUE
+    if isinstance(default, int):
+        return int(float(value))
+    if isinstance(default, float):
+        return float(value)
+    return value
+
+
+def load(inifile, defaults):
+    ''' Return a dictionary of the keys in defaults, each
+        converted to the type of its default value.
+        Missing or bad values get the default.
+        The file is parsed again only after it changed.
+    '''
+    key = stamp(inifile)
+    cached = _cache.get(inifile)
+    if cached is not None and cached[0] == key:
+        return dict(cached[1])
+
+    kvs = {}
+    with open(inifile, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line == "" or line.startswith('#') or '=' not in line:
+                continue
+            k, v = striplist(line.split('=', 1))
+            kvs[k] = v
+
+    values = {}
+    for k, default in defaults.items():
+        try:
+            values[k] = convert(kvs[k], default)
+        except KeyError:
+            values[k] = default
+        except ValueError:
+            print("Value Error:", k, kvs[k])
+            values[k] = default
+    _cache[inifile] = (key, values)
+    return dict(values)
+
+
+def changed(inifile):
+    ''' True if inifile differs from what load() last read '''
+    cached = _cache.get(inifile)
+    try:
+        return cached is None or cached[0] != stamp(inifile)
+    except OSError:
+        return False  # being saved, try again later
+
+
+def prefixed(inifile, prefix):
+    ''' all "prefix<name> = value" lines as {name: value} '''
+    found = {}
+    with open(inifile, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(prefix) and '=' in line:
+                k, v = striplist(line.split('=', 1))
+                found[k[len(prefix):]] = v
+    return found
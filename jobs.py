@@ -0,0 +1,260 @@
+# jobs.py
+# The job panel (Alt-Ctrl-J): many independent prompts at once while
+# the chat stays free. Prompts are typed one per item, or made from a
+# template whose {name} fields are filled from each item. Jobs run
+# on their own pool of `workers` threads through the same request
+# layer as the chat (shared client, rate limits, retries), each as a
+# one-shot conversation (role + prompt) or as a fork of the current
+# conversation. The list shows each job's progress and timing; the
+# selected reply can be merged into the chat.
+#
+# Items are separated by a line holding only ---. With several fields
+# in the template, the values of an item are separated by " | ".
+#
+
+import re
+from time import perf_counter
+import wx
+
+import metrics
+import reqworker
+
+SEPARATOR = re.compile(r'^---\s*$', re.MULTILINE)
+FIELD = re.compile(r'\{(\w+)\}')
+COLUMNS = (("#", 40), ("Prompt", 300), ("Status", 140), ("Time", 130), ("Tokens / cost", 160))
+
+
+def fields(template):
+    ''' the {name} fields of template, in order, each once '''
+    return list(dict.fromkeys(FIELD.findall(template)))
+
+
+def expand(template, items):
+    ''' the prompts for a template and the items text
+        no template: each item is a prompt
+        no fields:   the item follows the template
+        returns (prompts, error) '''
+    values = [v.strip() for v in SEPARATOR.split(items) if v.strip()]
+    template = template.strip()
+    if not template:
+        return values, None
+    names = fields(template)
+    if not names:
+        return [f"{template}\n\n{v}" for v in values], None
+    prompts = []
+    for n, item in enumerate(values, 1):
+        parts = [item] if len(names) == 1 else [p.strip() for p in item.split(" | ")]
+        if len(parts) != len(names):
+            return [], f"Item {n} has {len(parts)} value(s) for {len(names)} field(s)"
+        filled = dict(zip(names, parts))
+        prompts.append(FIELD.sub(lambda m: filled.get(m.group(1), m.group(0)), template))
+    return prompts, None
+
+
+class JobsFrame(wx.Frame):
+    ''' request(job, key, model, messages) runs on the workers
+        messages_for(prompt, fork) gives the messages of a job
+        on_merge(prompt, model, reply) puts a reply into the chat,
+            returns False if it could not
+        metrics (a metrics.Metrics) gets the figures of each job '''
+
+    def __init__(self, parent, key, model, request, messages_for, on_merge,
+                 prices, workers=3, metrics=None):
+        super(JobsFrame, self).__init__(parent, title="Jobs", size=(800, 700))
+        self.key = key
+        self.model = model
+        self.request = request
+        self.messages_for = messages_for
+        self.on_merge = on_merge
+        self.prices = prices
+        self.metrics = metrics
+        self.jobs = []       # in the order added, a row each
+        self.started = None  # first job of the current run
+
+        panel = wx.Panel(self)
+        self.template = wx.TextCtrl(panel, style=wx.TE_MULTILINE, size=(-1, 60))
+        self.template.SetHint("Template, e.g. Summarize in one line: {text}  (may be empty)")
+        self.items = wx.TextCtrl(panel, style=wx.TE_MULTILINE, size=(-1, 120))
+        self.items.SetHint("One prompt or value per item, items separated by a --- line")
+        self.fork = wx.RadioBox(panel, choices=["One-shot", "Fork of the conversation"])
+        add_btn = wx.Button(panel, label="Add jobs")
+        add_btn.SetToolTip("Queue one job per item")
+        top = wx.BoxSizer(wx.HORIZONTAL)
+        top.Add(self.fork, 0, wx.ALIGN_CENTER_VERTICAL)
+        top.AddStretchSpacer()
+        top.Add(add_btn, 0, wx.ALIGN_CENTER_VERTICAL)
+
+        self.list = wx.ListCtrl(panel, style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
+        for n, (title, width) in enumerate(COLUMNS):
+            self.list.InsertColumn(n, title, width=width)
+        self.reply = wx.TextCtrl(panel, style=wx.TE_MULTILINE | wx.TE_READONLY)
+        self.reply.SetFont(parent.text2.GetFont())
+        self.gauge = wx.Gauge(panel, range=1)
+        self.status = wx.StaticText(panel, label="")
+        merge_btn = wx.Button(panel, label="Merge into chat")
+        merge_btn.SetToolTip("Add the prompt and reply of the selected job to the conversation")
+        cancel_btn = wx.Button(panel, label="Cancel")
+        cancel_btn.SetToolTip("Cancel the selected job, or all unfinished ones if none is selected")
+        clear_btn = wx.Button(panel, label="Clear finished")
+        close_btn = wx.Button(panel, label="Close")
+        buttons = wx.BoxSizer(wx.HORIZONTAL)
+        buttons.Add(self.status, 1, wx.ALIGN_CENTER_VERTICAL)
+        for btn in (merge_btn, cancel_btn, clear_btn, close_btn):
+            buttons.Add(btn, 0, wx.LEFT, 5)
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(self.template, 0, wx.EXPAND | wx.ALL, 5)
+        sizer.Add(self.items, 0, wx.EXPAND | wx.LEFT | wx.RIGHT, 5)
+        sizer.Add(top, 0, wx.EXPAND | wx.ALL, 5)
+        sizer.Add(self.list, 1, wx.EXPAND | wx.LEFT | wx.RIGHT, 5)
+        sizer.Add(self.reply, 1, wx.EXPAND | wx.ALL, 5)
+        sizer.Add(self.gauge, 0, wx.EXPAND | wx.LEFT | wx.RIGHT, 5)
+        sizer.Add(buttons, 0, wx.EXPAND | wx.ALL, 5)
+        panel.SetSizer(sizer)
+
+        self.executor = reqworker.Executor(self, workers=max(1, workers))
+        self.Bind(reqworker.EVT_STREAM, self.on_stream)
+        self.Bind(reqworker.EVT_RESULT, self.on_result)
+        add_btn.Bind(wx.EVT_BUTTON, self.on_add)
+        merge_btn.Bind(wx.EVT_BUTTON, self.on_merge_reply)
+        cancel_btn.Bind(wx.EVT_BUTTON, self.on_cancel)
+        clear_btn.Bind(wx.EVT_BUTTON, self.on_clear)
+        close_btn.Bind(wx.EVT_BUTTON, lambda e: self.Close())
+        self.list.Bind(wx.EVT_LIST_ITEM_SELECTED, lambda e: self.show_reply())
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+        self.show_status()
+        self.Show()
+
+    # ----------------------------
+    #   Jobs
+    # ----------------------------
+
+    def on_add(self, event):
+        prompts, error = expand(self.template.GetValue(), self.items.GetValue())
+        if error:
+            wx.MessageBox(error, "Jobs", wx.OK | wx.ICON_ERROR)
+            return
+        if not prompts:
+            return
+        fork = self.fork.GetSelection() == 1
+        if not self.unfinished():
+            self.started = perf_counter()
+        for prompt in prompts:
+            job = reqworker.Job("job", self.request, self.key, self.model,
+                                self.messages_for(prompt, fork))
+            job.prompt = prompt
+            job.reply = ""
+            job.state = "queued"
+            row = self.list.GetItemCount()
+            self.list.InsertItem(row, str(len(self.jobs) + 1))
+            self.list.SetItem(row, 1, ("fork: " if fork else "") + prompt.replace("\n", " ")[:200])
+            self.list.SetItem(row, 2, job.state)
+            self.jobs.append(job)
+            self.executor.submit(job)
+        self.items.SetValue("")
+        self.show_status()
+
+    def unfinished(self):
+        return [job for job in self.jobs if job.finished is None and not job.is_cancelled()]
+
+    def on_stream(self, event):
+        job = event.job
+        if job not in self.jobs or job.is_cancelled():
+            return  # cleared or being cancelled
+        job.reply += event.text
+        self.set_row(job, f"streaming {len(job.reply)} chars",
+                     f"first token {job.ttft:.2f}s")
+        if self.selected() is job:
+            self.reply.AppendText(event.text)
+
+    def on_result(self, event):
+        job = event.job
+        if job not in self.jobs:
+            return
+        if job.is_cancelled():
+            self.set_row(job, "cancelled", "")  # the closed stream may raise, keep what came
+        elif event.error is not None:
+            self.set_row(job, "failed", f"{job.total():.2f}s")
+            job.reply = f"{type(event.error).__name__}: {event.error}"
+        else:
+            job.reply = event.result or job.reply
+            self.set_row(job, "done", *self.describe(job))
+        if self.selected() is job:
+            self.show_reply()
+        self.show_status()
+
+    def describe(self, job):
+        ''' time and tokens / cost columns of a finished job '''
+        rec = metrics.job_record("job", job, self.model, self.prices)
+        if self.metrics is not None:
+            self.metrics.add(rec)
+        times = f"wait {rec['queue']:.2f}s  total {rec['total']:.2f}s"
+        tokens = f"{rec['prompt']} / {rec['completion']}"
+        if rec['cost'] is not None:
+            tokens += f"  ${rec['cost']:.5f}"
+        return times, tokens
+
+    def set_row(self, job, state, times=None, tokens=None):
+        job.state = state
+        row = self.jobs.index(job)
+        self.list.SetItem(row, 2, state)
+        if times is not None:
+            self.list.SetItem(row, 3, times)
+        if tokens is not None:
+            self.list.SetItem(row, 4, tokens)
+
+    def show_status(self):
+        finished = [job for job in self.jobs if job.finished is not None or job.is_cancelled()]
+        running = sum(1 for job in self.jobs if job.started is not None and job.finished is None)
+        self.gauge.SetRange(max(1, len(self.jobs)))
+        self.gauge.SetValue(len(finished))
+        line = f"{len(finished)} of {len(self.jobs)} done, {running} running"
+        if self.started is not None:
+            line += f"   wall {perf_counter() - self.started:.2f}s"
+        self.status.SetLabel(line)
+
+    # ----------------------------
+    #   Buttons
+    # ----------------------------
+
+    def selected(self):
+        row = self.list.GetFirstSelected()
+        return self.jobs[row] if 0 <= row < len(self.jobs) else None
+
+    def show_reply(self):
+        job = self.selected()
+        self.reply.SetValue(job.reply if job is not None else "")
+
+    def on_merge_reply(self, event):
+        job = self.selected()
+        if job is None or job.state != "done":
+            wx.MessageBox("Select a finished job", "Jobs")
+            return
+        if self.on_merge(job.prompt, self.model, job.reply):
+            self.set_row(job, "merged")
+
+    def on_cancel(self, event):
+        chosen = self.selected()
+        for job in [chosen] if chosen is not None else self.unfinished():
+            if job.finished is None and not job.is_cancelled():
+                job.cancel()
+                self.set_row(job, "cancelling")
+
+    def on_clear(self, event):
+        ''' drop the finished jobs from the list '''
+        keep = [job for job in self.jobs if job.finished is None and not job.is_cancelled()]
+        for row in reversed(range(len(self.jobs))):
+            if self.jobs[row] not in keep:
+                self.list.DeleteItem(row)
+        self.jobs = keep
+        self.show_reply()
+        self.show_status()
+
+    def on_close(self, event):
+        ''' closing hides the panel, jobs go on (the app's exit stops them) '''
+        if event.CanVeto():
+            self.Hide()
+            event.Veto()
+            return
+        self.executor.shutdown()
+        self.Destroy()
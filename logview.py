@@ -0,0 +1,62 @@
+# logview.py
+# Pages through log.jsonl from the end, a few sessions at a time.
+# The file is memory-mapped and read backwards, so opening the
+# viewer costs the same for a 10 KB log as for a 100 MB one:
+# only the sessions actually shown are read and formatted.
+#
+
+import json
+import mmap
+import os
+
+import chatlog
+
+
+class LogPager:
+    def __init__(self, path=chatlog.LOG_FILE):
+        self.fin = None
+        self.mm = None
+        self.pos = 0  # everything before pos has not been shown yet
+        if os.path.isfile(path) and os.path.getsize(path) > 0:
+            self.fin = open(path, "rb")
+            self.mm = mmap.mmap(self.fin.fileno(), 0, access=mmap.ACCESS_READ)
+            self.pos = len(self.mm)
+
+    def at_start(self):
+        return self.pos == 0
+
+    def earlier(self, sessions=3):
+        ''' text of the sessions just before the ones shown so far
+            (oldest first) '''
+        blocks = []  # newest session first, records newest first
+        current = None
+        end = self.pos
+        while end > 0:
+            start = self.mm.rfind(b"\n", 0, end - 1) + 1
+            try:
+                rec = json.loads(self.mm[start:end])
+            except ValueError:
+                end = start
+                continue
+            if rec["session"] != current:
+                if len(blocks) == sessions:
+                    break  # leave this line for the next page
+                current = rec["session"]
+                blocks.append([])
+            blocks[-1].append(rec)
+            end = start
+        self.pos = end
+
+        parts = []
+        for block in reversed(blocks):
+            block.reverse()
+            parts.append(chatlog.session_header(block[0]))
+            parts.extend(chatlog.format_record(rec) for rec in block)
+            parts.append("=" * 40 + "\n\n")
+        return "".join(parts)
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.fin.close()
+            self.mm = None
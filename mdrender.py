@@ -0,0 +1,75 @@
+# mdrender.py
+# Markdown to HTML with a cache of rendered fragments.
+# Each message is rendered whole, once, and kept by the hash of its
+# content, so the preview and the HTML export only render what is new
+# or changed. Only a reply still streaming in is rendered block by
+# block; cutting Markdown at blank lines breaks loose lists and
+# reference links, so that is never done for finished text.
+#
+
+import hashlib
+import html
+from collections import OrderedDict
+
+EXTENSIONS = ['tables', 'fenced_code']
+
+
+def split_blocks(text):
+    ''' split Markdown at blank lines outside code fences '''
+    blocks = []
+    current = []
+    fence = None
+    for line in text.split("\n"):
+        stripped = line.lstrip()
+        if fence is None and stripped[:3] in ("```", "~~~"):
+            fence = stripped[:3]
+        elif fence is not None and stripped.startswith(fence):
+            fence = None
+        if fence is None and not stripped and current:
+            blocks.append("\n".join(current))
+            current = []
+        elif stripped or current:
+            current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+class RenderCache:
+    def __init__(self, max_items=2000):
+        self.max_items = max_items
+        self.items = OrderedDict()  # hash -> html
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text):
+        ''' HTML for a Markdown fragment '''
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        fragment = self.items.get(key)
+        if fragment is not None:
+            self.items.move_to_end(key)
+            self.hits += 1
+            return fragment
+        import markdown
+        fragment = markdown.markdown(text, extensions=EXTENSIONS)
+        self.misses += 1
+        self.items[key] = fragment
+        if len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+        return fragment
+
+    def render_blocks(self, text):
+        ''' HTML for text still streaming in, block by block, so each
+            update renders only the last block (close enough until the
+            whole message is rendered) '''
+        return "".join(self.render(b) for b in split_blocks(text))
+
+    def message(self, msg):
+        ''' HTML for one chat message with its role '''
+        return (f"<h4>{html.escape(msg['role'].upper())}</h4>\n"
+                + self.render(msg["content"]))
+
+
+def page(body):
+    return ("<html><head><meta charset='utf-8'></head><body>\n"
+            + body + "\n</body></html>")
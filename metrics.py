@@ -0,0 +1,174 @@
+# metrics.py
+# Where time and money go: one record per request in metrics.jsonl.
+#   chat, compare, job
+#                  queue wait, time to first token, total time,
+#                  prompt / cached / completion tokens and cost,
+#                  what the prompt cache saved ($ and estimated seconds)
+#   tts            one synthesis call of openvoc (seconds, characters,
+#                  served from the audio cache or not)
+#   speech         one spoken reply (time to first audio, total)
+# Records are written by a chatlog.ChatLog writer thread. The current
+# session is also kept in memory for the status bar aggregates.
+#   python metrics.py [metrics.jsonl]   per-session report
+#
+# The seconds saved by the prompt cache are not reported by the API.
+# They are estimated from the session: a line fitted through the time
+# to first token against the uncached prompt tokens gives the time one
+# token takes to process, and each cached token saves that.
+#
+
+import math
+import sys
+import threading
+from time import localtime, strftime, time
+
+import chatlog
+import pricing
+
+METRICS_FILE = "metrics.jsonl"
+TIMES = ("queue", "ttft", "total", "ttfa", "seconds")
+PREFILL_SAMPLES = 10  # streamed requests needed before estimating seconds saved
+
+
+def percentile(values, p):
+    ''' the p-th percentile (0-100) of values, nearest rank '''
+    if not values:
+        return None
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))
+    return values[k]
+
+
+def ratio(part, whole):
+    return part / whole if whole else 0.0
+
+
+def job_record(kind, job, model, prices):
+    ''' the metrics of a finished reqworker.Job '''
+    prompt, cached, completion = pricing.usage_counts(job.usage)
+    rec = {"kind": kind, "model": model,
+           "queue": job.started - job.queued,
+           "ttft": job.ttft,
+           "total": job.total(),
+           "prompt": prompt, "cached": cached, "completion": completion,
+           "cost": pricing.cost(prices, model, prompt, cached, completion),
+           "saved": pricing.saved(prices, model, cached)}
+    if job.is_cancelled():
+        rec["cancelled"] = True
+    return rec
+
+
+class Aggregate:
+    ''' count, sums and percentiles of a list of records '''
+
+    def __init__(self, records):
+        self.records = records
+
+    def values(self, key):
+        return [r[key] for r in self.records if r.get(key) is not None]
+
+    def sum(self, key):
+        return sum(self.values(key))
+
+    def line(self):
+        ''' one line summary, as in the status bar and the report '''
+        parts = [f"{len(self.records)} req"]
+        for key in TIMES:
+            v = self.values(key)
+            if v:
+                parts.append(f"{key} p50 {percentile(v, 50):.2f}s p95 {percentile(v, 95):.2f}s")
+        tokens = self.sum("prompt") + self.sum("completion")
+        if tokens:
+            parts.append(f"{tokens} tokens")
+        if self.values("prompt"):
+            parts.append(self.cache_line())
+        elif self.values("cost"):
+            parts.append(f"${self.sum('cost'):.4f}")
+        return "   ".join(parts)
+
+    def cache_line(self):
+        ''' prompt cache hits and what they saved '''
+        cached = self.sum("cached")
+        line = f"{cached} cached ({ratio(cached, self.sum('prompt')):.0%} hit)"
+        if self.values("cost"):
+            line += f"   ${self.sum('cost'):.4f}"
+        if self.values("saved"):
+            line += f" (saved ${self.sum('saved'):.4f}"
+            if self.values("saved_s"):
+                line += f", ~{self.sum('saved_s'):.1f}s"
+            line += ")"
+        return line
+
+    def prefill_rate(self):
+        ''' seconds per uncached prompt token, None until there are
+            enough streamed requests of different sizes '''
+        points = [(r["prompt"] - r["cached"], r["ttft"]) for r in self.records
+                  if r.get("ttft") is not None and r.get("prompt")]
+        if len(points) < PREFILL_SAMPLES:
+            return None
+        mx = sum(x for x, y in points) / len(points)
+        my = sum(y for x, y in points) / len(points)
+        var = sum((x - mx) ** 2 for x, y in points)
+        if not var:
+            return None
+        slope = sum((x - mx) * (y - my) for x, y in points) / var
+        return slope if slope > 0 else None
+
+
+class Metrics:
+    ''' collects the records of one session
+        add() may be called from any thread '''
+
+    def __init__(self, session, path=METRICS_FILE):
+        self.session = session
+        self.lock = threading.Lock()
+        self.records = []
+        self.writer = chatlog.ChatLog(path) if path else None
+
+    def add(self, rec):
+        ''' record rec, with the seconds the prompt cache saved it
+            when there is an estimate, and return it '''
+        rec = dict(rec, session=self.session, ts=time())
+        with self.lock:
+            if rec.get("cached"):
+                rate = Aggregate([r for r in self.records
+                                  if r["kind"] == rec["kind"]]).prefill_rate()
+                if rate is not None:
+                    rec["saved_s"] = rec["cached"] * rate
+            self.records.append(rec)
+        if self.writer is not None:
+            self.writer.write(rec)
+        return rec
+
+    def session_total(self, kind=None):
+        ''' Aggregate of this session, of one kind or all '''
+        with self.lock:
+            records = [r for r in self.records if kind is None or r["kind"] == kind]
+        return Aggregate(records)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def report(path=METRICS_FILE, out=sys.stdout):
+    ''' per-session, per-kind aggregates of a metrics file '''
+    sessions = {}  # session -> kind -> records, in file order
+    for rec in chatlog.read_records(path):
+        sessions.setdefault(rec.get("session"), {}).setdefault(rec.get("kind"), []).append(rec)
+    everything = {}
+    for session, kinds in sessions.items():
+        first = min(r["ts"] for recs in kinds.values() for r in recs)
+        day = strftime("%a %d %b %Y %H:%M", localtime(first))
+        print(f"=== session {session}, {day}", file=out)
+        for kind, recs in kinds.items():
+            print(f"  {kind:8} {Aggregate(recs).line()}", file=out)
+            everything.setdefault(kind, []).extend(recs)
+    if len(sessions) > 1:
+        print("=== all sessions", file=out)
+        for kind, recs in everything.items():
+            print(f"  {kind:8} {Aggregate(recs).line()}", file=out)
+
+
+if __name__ == '__main__':
+    report(sys.argv[1] if len(sys.argv) > 1 else METRICS_FILE)
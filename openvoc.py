@@ -1,15 +1,44 @@
 # openvoc.py
 # requires openai and mpv player for Linux
+# uses the shared client from aiclient
 # no player is required for Windows
 #    VOICES:
 #    'alloy','ash','ballad','coral','echo','fable','nova','onyx','sage','shimmer'
 #    EXAMPLE:
 #    openvoc.textospeech('nova', 'speech.mp3', 'Hello, this is nova speaking.')
 #
+# Replays and announcements keep their audio in a content-addressed
+# cache (audiocache/), keyed by voice, model, format and text, so
+# they play at once the next time without calling the API. A reply
+# spoken while it streams in goes from the API straight to the
+# player, without touching the disk.
+#
+# Set on_metric to a function taking a dict to get the timing of each
+# synthesis ("tts") and of each spoken reply ("speech"), see metrics.py
+#
 
-import openai
+import aiclient
+import hashlib
+import os
 import subprocess
+import tempfile
 import platform
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+on_metric = None
+
+
+def _metric(rec):
+    if on_metric is not None:
+        try:
+            on_metric(rec)
+        except Exception as e:
+            print("Metric Error:", e)
+
 
 def play_file(speech_file_path):
     ''' Play the audio file currently set
@@ -26,18 +55,226 @@ def textospeech(voc, fou, inp):
         get parameters from GUI
         (response is an mp3 audio file)
         and get response from openai
+        fou is no longer written: each text has its own
+        file in the cache, so playbacks never clobber each other
     '''
-    speech_file_path = fou
-
     try:
-        with openai.audio.speech.with_streaming_response.create(
-          model="gpt-4o-mini-tts",
-          voice=voc,
-          response_format="mp3",
-          input=inp
-        ) as response:
-          response.stream_to_file(speech_file_path)
-          play_file(speech_file_path)
-          return 0  # success
+        play_file(cached_audio(voc, inp, "mp3"))
+        return 0  # success
     except Exception as e:
         return 2  # problems
+
+
+# ----------------------------
+# Audio cache
+# ----------------------------
+
+CACHE_DIR = "audiocache"
+CACHE_MAX = 100_000_000  # bytes kept before the least used files go
+EVICT_EVERY = 5_000_000  # bytes written between two evictions
+_cache_lock = threading.Lock()
+_written = None  # bytes written since the last eviction, None before the first
+
+
+def cache_path(voc, inp, fmt):
+    key = f"{voc}\0{TTS_MODEL}\0{fmt}\0{inp}".encode("utf-8")
+    return os.path.join(CACHE_DIR, hashlib.sha256(key).hexdigest() + "." + fmt)
+
+
+def cached_audio(voc, inp, fmt="mp3"):
+    ''' path of the audio for inp, synthesized only when not cached '''
+    global _written
+    path = cache_path(voc, inp, fmt)
+    started = time.perf_counter()
+    if os.path.isfile(path):
+        try:
+            os.utime(path)  # recently used
+            _metric({"kind": "tts", "model": TTS_MODEL, "chars": len(inp),
+                     "seconds": time.perf_counter() - started, "cached_audio": True})
+            return path
+        except OSError:
+            pass  # evicted meanwhile
+    audio = synthesized(voc, inp, fmt)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # write aside, then rename: readers never see half a file
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".part")
+    with os.fdopen(fd, "wb") as fout:
+        fout.write(audio)
+    os.replace(tmp, path)
+    # the directory is scanned on the first write, then every EVICT_EVERY bytes
+    with _cache_lock:
+        due = _written is None or _written + len(audio) >= EVICT_EVERY
+        _written = 0 if due else _written + len(audio)
+    if due:
+        evict()
+    return path
+
+
+def cached_bytes(voc, inp, fmt="pcm"):
+    ''' the audio for inp, from the cache or synthesized into it '''
+    with open(cached_audio(voc, inp, fmt), "rb") as fin:
+        return fin.read()
+
+
+def evict(max_bytes=None):
+    ''' remove the least recently used files beyond max_bytes '''
+    max_bytes = CACHE_MAX if max_bytes is None else max_bytes
+    with _cache_lock:
+        files = []
+        total = 0
+        now = time.time()
+        for entry in os.scandir(CACHE_DIR):
+            st = entry.stat()
+            if entry.name.endswith(".part"):
+                if now - st.st_mtime > 3600:  # left by a crash
+                    _remove(entry.path)
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+        files.sort()
+        for mtime, size, path in files:
+            if total <= max_bytes:
+                break
+            if _remove(path):
+                total -= size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:  # in use (Windows)
+        return False
+
+
+# ----------------------------
+# Pipelined speech: speak a reply sentence by sentence while it
+# is still arriving. Chunks are synthesized in parallel (bounded)
+# as raw PCM and written in order to one mpv reading stdin.
+# ----------------------------
+
+TTS_MODEL = "gpt-4o-mini-tts"
+PCM_PLAYER = ['mpv', '--no-terminal', '--no-video', '--demuxer=rawaudio',
+              '--demuxer-rawaudio-rate=24000', '--demuxer-rawaudio-channels=1',
+              '--demuxer-rawaudio-format=s16le', '-']
+SENTENCE_END = re.compile(r'[.!?]["\')\]]*\s+|\n\s*\n')
+CHUNK_LEN = 300  # characters per chunk after the first sentence
+
+
+def split_sentences(text):
+    ''' the complete sentences in text and the unfinished rest '''
+    out = []
+    start = 0
+    for m in SENTENCE_END.finditer(text):
+        sentence = text[start:m.end()].strip()
+        if sentence:
+            out.append(sentence)
+        start = m.end()
+    return out, text[start:]
+
+
+def synthesize(voc, inp, fmt="pcm"):
+    ''' audio bytes for inp from the API '''
+    with aiclient.get_client().audio.speech.with_streaming_response.create(
+        model=TTS_MODEL,
+        voice=voc,
+        response_format=fmt,
+        input=inp
+    ) as response:
+        return response.read()
+
+
+def synthesized(voc, inp, fmt="pcm"):
+    ''' audio bytes for inp straight from the API, not cached '''
+    started = time.perf_counter()
+    audio = synthesize(voc, inp, fmt)
+    _metric({"kind": "tts", "model": TTS_MODEL, "chars": len(inp),
+             "seconds": time.perf_counter() - started, "bytes": len(audio)})
+    return audio
+
+
+class SpeechPipeline:
+    ''' feed() text as it arrives, finish() when it is complete
+        on_error(message) is called from a background thread
+        cache: keep the audio in audiocache/ (for replays) '''
+
+    def __init__(self, voc, workers=3, on_error=None, cache=False):
+        self.voc = voc
+        self.on_error = on_error
+        self.audio = cached_bytes if cache else synthesized
+        self.started = time.perf_counter()
+        self.ttfa = None  # seconds to the first audio
+        self.pending = ""  # text that is not a whole sentence yet
+        self.chunk = []
+        self.first = True
+        self.text = []  # everything fed, for Windows
+        self.cancelled = threading.Event()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.chunks = queue.Queue()  # futures in speaking order
+        self.player = None
+        if platform.system() != "Windows":
+            threading.Thread(target=self._play, daemon=True).start()
+
+    def feed(self, text):
+        self.text.append(text)
+        sentences, self.pending = split_sentences(self.pending + text)
+        for sentence in sentences:
+            self.chunk.append(sentence)
+            # the first sentence goes alone, so sound starts early
+            if self.first or sum(len(s) for s in self.chunk) >= CHUNK_LEN:
+                self._submit()
+
+    def finish(self):
+        if self.pending.strip():
+            self.chunk.append(self.pending.strip())
+        self.pending = ""
+        self._submit()
+        if platform.system() == "Windows":
+            # no stdin player: one file for the whole text
+            self.pool.submit(textospeech, self.voc, 'speek.mp3', "".join(self.text))
+        self.chunks.put(None)
+        self.pool.shutdown(wait=False)
+
+    def cancel(self):
+        self.cancelled.set()
+        self.chunks.put(None)
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        if self.player is not None:
+            self.player.kill()
+
+    def _submit(self):
+        if not self.chunk or self.cancelled.is_set():
+            return
+        if platform.system() != "Windows":
+            text = " ".join(self.chunk)
+            self.chunks.put(self.pool.submit(self.audio, self.voc, text, "pcm"))
+        self.chunk = []
+        self.first = False
+
+    def _play(self):
+        try:
+            while not self.cancelled.is_set():
+                future = self.chunks.get()
+                if future is None:
+                    break
+                audio = future.result()
+                if self.cancelled.is_set():
+                    break
+                if self.player is None:
+                    self.player = subprocess.Popen(PCM_PLAYER, stdin=subprocess.PIPE)
+                    self.ttfa = time.perf_counter() - self.started
+                self.player.stdin.write(audio)
+                self.player.stdin.flush()
+        except Exception as e:
+            if not self.cancelled.is_set() and self.on_error is not None:
+                self.on_error(str(e))
+        finally:
+            if self.player is not None and self.player.stdin:
+                try:
+                    self.player.stdin.close()
+                except OSError:
+                    pass
+            _metric({"kind": "speech", "model": TTS_MODEL, "ttfa": self.ttfa,
+                     "total": time.perf_counter() - self.started,
+                     "chars": sum(len(t) for t in self.text),
+                     "cancelled": self.cancelled.is_set()})
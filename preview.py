@@ -0,0 +1,66 @@
+# preview.py
+# Rendered Markdown preview of the conversation (Ctrl-P).
+# Messages already shown are never rendered again: new ones are
+# appended to the page, and while a reply streams in only its
+# last block is rendered again.
+#
+
+import wx
+import wx.html
+
+import mdrender
+
+# seconds between preview updates while a reply streams in
+PREVIEW_FLUSH = 0.25
+
+
+class PreviewFrame(wx.Frame):
+    def __init__(self, parent, renderer):
+        super(PreviewFrame, self).__init__(parent, title="wxAIchat Preview",
+                                           size=(650, 600))
+        self.renderer = renderer
+        self.view = wx.html.HtmlWindow(self)
+        self.shown = []      # fragments on the page, one per message
+        self.tail = ""       # reply still streaming in
+        self.tail_shown = False  # the page has a tail after the messages
+        self.pending = None  # wx.CallLater for the tail
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+
+    def on_close(self, event):
+        self.Hide()  # keep the fragments for next time
+
+    def set_messages(self, messages):
+        ''' show messages; only new ones are rendered and appended '''
+        fragments = [self.renderer.message(m) for m in messages
+                     if m["role"] != "system"]
+        self.tail = ""
+        self._cancel()
+        if self.shown == fragments[:len(self.shown)] and not self.tail_shown:
+            for fragment in fragments[len(self.shown):]:
+                self.view.AppendToPage(fragment)
+        else:
+            self.view.SetPage(mdrender.page("".join(fragments)))
+        self.shown = fragments
+        self.tail_shown = False
+        self.view.Scroll(-1, self.view.GetScrollRange(wx.VERTICAL))
+
+    def set_tail(self, text):
+        ''' the reply so far, shown at most every PREVIEW_FLUSH seconds '''
+        self.tail = text
+        if self.pending is None:
+            self.pending = wx.CallLater(int(PREVIEW_FLUSH * 1000), self._show_tail)
+
+    def _show_tail(self):
+        self.pending = None
+        if not self.tail:
+            return
+        body = "".join(self.shown) + "<h4>ASSISTANT</h4>\n" \
+            + self.renderer.render_blocks(self.tail)
+        self.view.SetPage(mdrender.page(body))
+        self.tail_shown = True
+        self.view.Scroll(-1, self.view.GetScrollRange(wx.VERTICAL))
+
+    def _cancel(self):
+        if self.pending is not None:
+            self.pending.Stop()
+            self.pending = None
@@ -0,0 +1,54 @@
+# pricing.py
+# Model prices from options.ini ("price.<model> = input, cached, output"
+# in $ per 1M tokens) and the cost of a request from its usage.
+#
+
+import iniproc
+
+
+def load_prices(inifile="options.ini"):
+    ''' {model: (input, cached, output)} '''
+    prices = {}
+    for model, value in iniproc.prefixed(inifile, "price.").items():
+        try:
+            p = [float(x) for x in value.split(",")]
+            prices[model] = (p[0], p[1], p[2])
+        except (ValueError, IndexError):
+            print("Price Error:", model, value)
+    return prices
+
+
+def price_for(prices, model):
+    ''' prices of model, also for dated names like gpt-4.1-mini-2025-04-14 '''
+    if model in prices:
+        return prices[model]
+    best = ""
+    for name in prices:
+        if model.startswith(name) and len(name) > len(best):
+            best = name
+    return prices.get(best)
+
+
+def usage_counts(usage):
+    ''' (prompt, cached, completion) tokens from an API usage object '''
+    if usage is None:
+        return (0, 0, 0)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    return (usage.prompt_tokens or 0, cached, usage.completion_tokens or 0)
+
+
+def cost(prices, model, prompt, cached, completion):
+    ''' $ for a request, None if the model has no price '''
+    p = price_for(prices, model)
+    if p is None:
+        return None
+    return ((prompt - cached) * p[0] + cached * p[1] + completion * p[2]) / 1_000_000
+
+
+def saved(prices, model, cached):
+    ''' $ the prompt cache saved on cached tokens, None if no price '''
+    p = price_for(prices, model)
+    if p is None:
+        return None
+    return cached * (p[0] - p[1]) / 1_000_000
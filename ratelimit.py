@@ -0,0 +1,75 @@
+# ratelimit.py
+# Requests and tokens per minute limits, shared by worker threads.
+# Each limit is a token bucket that holds one minute's allowance and
+# refills continuously, so a burst up to the limit goes out at once
+# and after that requests are spaced evenly.
+#
+
+import threading
+from time import monotonic, sleep
+
+
+class Bucket:
+    ''' per_minute units, refilled continuously (0 means no limit) '''
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.stamp = monotonic()
+
+    def refill(self, now):
+        if self.capacity:
+            self.level = min(self.capacity,
+                             self.level + (now - self.stamp) * self.capacity / 60.0)
+        self.stamp = now
+
+    def wait_for(self, amount):
+        ''' seconds until amount is available (0 if it is now) '''
+        if not self.capacity:
+            return 0.0
+        amount = min(amount, self.capacity)  # a huge request waits for a full bucket
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.capacity
+
+
+class RateLimiter:
+    ''' rpm requests and tpm tokens per minute, 0 for no limit '''
+
+    def __init__(self, rpm=0, tpm=0):
+        self.lock = threading.Lock()
+        self.requests = Bucket(rpm)
+        self.tokens = Bucket(tpm)
+        self.paused_until = 0.0  # set when the server says slow down
+
+    def acquire(self, tokens=0, cancelled=None):
+        ''' block until one request of about tokens tokens may go out
+            returns False if cancelled (a threading.Event) was set '''
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                wait = max(self.requests.wait_for(1), self.tokens.wait_for(tokens),
+                           self.paused_until - now)
+                if wait <= 0.0:
+                    self.requests.level -= 1
+                    self.tokens.level -= tokens
+                    return True
+            if cancelled is not None:
+                if cancelled.wait(min(wait, 1.0)):
+                    return False
+            else:
+                sleep(min(wait, 1.0))
+
+    def pause(self, seconds):
+        ''' let no request out for seconds (after a 429) '''
+        with self.lock:
+            self.paused_until = max(self.paused_until, monotonic() + seconds)
+
+    def adjust(self, tokens):
+        ''' correct the estimate once the real count is known
+            (tokens > 0 charges more, < 0 gives some back) '''
+        with self.lock:
+            if self.tokens.capacity:
+                self.tokens.level = min(self.tokens.capacity, self.tokens.level - tokens)
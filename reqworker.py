@@ -0,0 +1,166 @@
+# reqworker.py
+# Runs the blocking API calls (chat and voice) on background
+# threads so the wx main loop keeps painting and taking keys.
+# Results are posted back to the GUI as custom wx events.
+#
+
+import queue
+import threading
+from time import perf_counter
+import wx
+import wx.lib.newevent
+
+# posted with the collected deltas of a streaming reply
+StreamEvent, EVT_STREAM = wx.lib.newevent.NewEvent()
+# posted once a job is finished (job, result, error)
+ResultEvent, EVT_RESULT = wx.lib.newevent.NewEvent()
+
+# seconds between screen updates while a reply is streaming in
+STREAM_FLUSH = 0.05
+
+
+class Job:
+    ''' one unit of work for an Executor
+        func is called as func(job, *args) on a worker thread
+        kind tells the GUI what to do with the result '''
+
+    def __init__(self, kind, func, *args):
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.target = None
+        self.cancelled = threading.Event()
+        self.queued = perf_counter()
+        self.started = None
+        self.finished = None
+        self.ttft = None
+        self.usage = None   # API usage of the reply, if reported
+        self.shown = False  # GUI has shown the first delta
+        self.parts = []
+        self.flushed = 0.0
+        self.closers = []         # called on cancel, e.g. to close a response
+        self.abandoned = False    # nobody waits for the result any more
+
+    def cancel(self):
+        self.cancelled.set()
+        for close in list(self.closers):
+            try:
+                close()
+            except Exception:
+                pass  # the worker sees the closed response fail
+
+    def on_cancel(self, close):
+        ''' call close() when the job is cancelled (now, if it is) '''
+        self.closers.append(close)
+        if self.is_cancelled():
+            close()
+
+    def is_cancelled(self):
+        return self.cancelled.is_set()
+
+    def total(self):
+        ''' seconds from start to finish (or until now) '''
+        if self.started is None:
+            return 0.0
+        return (self.finished or perf_counter()) - self.started
+
+    def emit(self, delta):
+        ''' collect a streamed delta, post it to the GUI
+            at most every STREAM_FLUSH seconds '''
+        now = perf_counter()
+        if self.ttft is None:
+            self.ttft = now - self.started
+        self.parts.append(delta)
+        if now - self.flushed >= STREAM_FLUSH:
+            self.flush()
+
+    def flush(self):
+        ''' post whatever deltas are still collected '''
+        if self.parts:
+            text = "".join(self.parts)
+            self.parts = []
+            post(self.target, StreamEvent(job=self, text=text))
+        self.flushed = perf_counter()
+
+
+def post(target, event):
+    ''' wx.PostEvent that tolerates a window already destroyed '''
+    try:
+        wx.PostEvent(target, event)
+    except RuntimeError:
+        pass
+
+
+class Executor:
+    ''' a small pool of daemon threads taking jobs in order '''
+
+    def __init__(self, target, workers=1):
+        self.target = target
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.active = set()  # submitted and not finished
+        self.threads = []
+        self.extra = 0       # threads to retire, one per abandoned job
+        for _ in range(workers):
+            self._start_thread()
+
+    def _start_thread(self):
+        t = threading.Thread(target=self._loop, daemon=True)
+        t.start()
+        self.threads.append(t)
+
+    def submit(self, job):
+        job.target = self.target
+        with self.lock:
+            self.active.add(job)
+        self.jobs.put(job)
+        return job
+
+    def abandon(self, job):
+        ''' cancel job and stop waiting for it: no result is posted, and
+            if it is running a new thread takes the next jobs meanwhile '''
+        job.cancel()
+        with self.lock:
+            if job not in self.active:
+                return
+            self.active.discard(job)
+            job.abandoned = True
+            if job.started is not None:
+                self.extra += 1
+                self._start_thread()
+
+    def cancel_all(self):
+        with self.lock:
+            for job in self.active:
+                job.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        for _ in self.threads:
+            self.jobs.put(None)
+
+    def _loop(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            result, error = None, None
+            with self.lock:  # so abandon() knows whether it started
+                if not job.is_cancelled():
+                    job.started = perf_counter()
+            if job.started is not None:
+                job.flushed = job.started
+                try:
+                    result = job.func(job, *job.args)
+                    job.flush()
+                except Exception as e:
+                    error = e
+                job.finished = perf_counter()
+            with self.lock:
+                self.active.discard(job)
+                if job.abandoned:
+                    if self.extra and job.started is not None:
+                        self.extra -= 1
+                        return  # its replacement goes on
+                    continue
+            post(self.target, ResultEvent(job=job, result=result, error=error))
@@ -0,0 +1,98 @@
+# respcache.py
+# On-disk cache of chat replies (opt-in with cache=on).
+# Keyed by a hash of the model and the exact messages sent, so
+# re-running the same prompt in the same context answers at once.
+# Entries expire after ttl seconds; the least recently used ones
+# are dropped when the cache grows past its size cap.
+#
+
+import hashlib
+import json
+import sqlite3
+from time import time
+
+DB_FILE = "cache.db"
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS replies(
+    key TEXT PRIMARY KEY, created REAL, used REAL, size INTEGER, reply TEXT);
+CREATE INDEX IF NOT EXISTS replies_used ON replies(used);
+'''
+
+
+def normalize(text):
+    return text.replace("\r\n", "\n").strip()
+
+
+def cache_key(model, messages, **params):
+    ''' stable hash of everything that decides the reply '''
+    data = {
+        "model": model,
+        "messages": [[m["role"], normalize(m["content"])] for m in messages],
+        "params": params,
+    }
+    blob = json.dumps(data, sort_keys=True, separators=(",", ":"),
+                      ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=DB_FILE, max_bytes=50_000_000, ttl=7 * 86400):
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # seconds, 0 means no expiry
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def get(self, key):
+        ''' the cached reply or None '''
+        row = self.db.execute(
+            "SELECT created, reply FROM replies WHERE key = ?", (key,)).fetchone()
+        now = time()
+        if row is not None and self.ttl and now - row[0] > self.ttl:
+            self.db.execute("DELETE FROM replies WHERE key = ?", (key,))
+            self.db.commit()
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.db.execute("UPDATE replies SET used = ? WHERE key = ?", (now, key))
+        self.db.commit()
+        self.hits += 1
+        return row[1]
+
+    def put(self, key, reply):
+        now = time()
+        size = len(reply.encode("utf-8"))
+        self.db.execute("INSERT OR REPLACE INTO replies VALUES(?, ?, ?, ?, ?)",
+                        (key, now, now, size, reply))
+        self.evict()
+        self.db.commit()
+
+    def evict(self):
+        ''' drop expired entries, then the least recently used
+            ones until the cache fits in max_bytes '''
+        if self.ttl:
+            self.db.execute("DELETE FROM replies WHERE created < ?",
+                            (time() - self.ttl,))
+        total = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM replies").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.db.execute("SELECT key, size FROM replies ORDER BY used")
+        drop = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            drop.append((key,))
+            total -= size
+        self.db.executemany("DELETE FROM replies WHERE key = ?", drop)
+
+    def clear(self):
+        self.db.execute("DELETE FROM replies")
+        self.db.commit()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        return f"cache {self.hits} hits / {self.misses} misses"
@@ -0,0 +1,243 @@
+# responseview.py
+# The response area, built on wx.stc.StyledTextCtrl (Scintilla)
+# instead of a native multiline TextCtrl:
+#   - text is kept in a gap buffer, so AppendText of a streamed delta
+#     costs the size of the delta, not of the whole response
+#   - only the lines that get shown are laid out and styled: headings,
+#     log headers and code fences are styled on demand by a container
+#     lexer that carries the fence state from line to line
+#   - search matches are marked with an indicator, not by restyling
+#   - no undo history is kept, so a big log is held only once
+# Scintilla counts positions in UTF-8 bytes, the rest of the app (the
+# search engine, the code index) in characters. The TextCtrl-style
+# methods below take and return character offsets and convert, with a
+# shortcut while the text is all ASCII. Otherwise an offset is mapped
+# from the start of its line, using the character offset of each line
+# start (worked out once per content change), so a conversion costs
+# the length of one line, not of the text before it.
+#
+
+import re
+from bisect import bisect_right
+
+import wx
+import wx.stc as stc
+
+import codeblocks
+
+STYLE_TEXT = 0
+STYLE_HEADING = 1
+STYLE_ROLE = 2     # USER: / ASSISTANT: / === Chat on ... ===
+STYLE_FENCE = 3
+STYLE_CODE = 4
+
+INDIC_MATCH = 8    # indicators below 8 belong to lexers
+MATCH_COLOUR = wx.Colour(255, 200, 0)
+CODE_BACK = wx.Colour(245, 245, 245)
+ROLES = ("USER:", "ASSISTANT:", "SYSTEM:", "===")
+LINE_END = re.compile(r'\r\n|\r|\n')  # the line ends Scintilla knows
+
+
+class ResponseView(stc.StyledTextCtrl):
+
+    def __init__(self, parent):
+        super(ResponseView, self).__init__(parent)
+        self.ascii = True      # byte offsets are character offsets
+        self.updating = False  # inside one of the methods below
+        self.starts = None     # character offset of each line start, made on demand
+        self.SetCodePage(stc.STC_CP_UTF8)
+        self.SetUndoCollection(False)
+        self.SetWrapMode(stc.STC_WRAP_WORD)
+        self.SetLayoutCache(stc.STC_CACHE_PAGE)
+        self.SetMarginWidth(1, 0)
+        self.SetScrollWidthTracking(True)
+        self.SetScrollWidth(1)
+        self.SetModEventMask(stc.STC_MOD_INSERTTEXT | stc.STC_MOD_DELETETEXT)
+        self.SetLexer(stc.STC_LEX_CONTAINER)
+        self.IndicatorSetStyle(INDIC_MATCH, stc.STC_INDIC_FULLBOX)
+        self.IndicatorSetForeground(INDIC_MATCH, MATCH_COLOUR)
+        self.IndicatorSetAlpha(INDIC_MATCH, 120)
+        self.IndicatorSetUnder(INDIC_MATCH, True)
+        self.set_styles()
+        self.Bind(stc.EVT_STC_STYLENEEDED, self.on_style_needed)
+        self.Bind(stc.EVT_STC_MODIFIED, self.on_modified)
+
+    # ----------------------------
+    #   Styles
+    # ----------------------------
+
+    def set_styles(self):
+        ''' the styles, from the default style's font '''
+        self.StyleClearAll()
+        self.StyleSetBold(STYLE_HEADING, True)
+        self.StyleSetForeground(STYLE_HEADING, wx.Colour(0, 70, 140))
+        self.StyleSetBold(STYLE_ROLE, True)
+        self.StyleSetForeground(STYLE_ROLE, wx.Colour(110, 110, 110))
+        self.StyleSetForeground(STYLE_FENCE, wx.Colour(140, 140, 140))
+        self.StyleSetBackground(STYLE_FENCE, CODE_BACK)
+        self.StyleSetEOLFilled(STYLE_FENCE, True)
+        self.StyleSetForeground(STYLE_CODE, wx.Colour(30, 90, 30))
+        self.StyleSetBackground(STYLE_CODE, CODE_BACK)
+        self.StyleSetEOLFilled(STYLE_CODE, True)
+
+    def SetFont(self, font):
+        super(ResponseView, self).SetFont(font)
+        self.StyleSetFont(stc.STC_STYLE_DEFAULT, font)
+        self.set_styles()
+        self.ClearDocumentStyle()  # styled again when shown
+        return True
+
+    def on_style_needed(self, event):
+        ''' style whole lines from the first unstyled one up to the
+            position Scintilla needs, usually the end of the screen '''
+        line = self.LineFromPosition(self.GetEndStyled())
+        last = self.LineFromPosition(event.GetPosition())
+        fence = self.GetLineState(line - 1) if line > 0 else 0
+        self.StartStyling(self.PositionFromLine(line))
+        while line <= last:
+            start = self.PositionFromLine(line)
+            length = self.PositionFromLine(line + 1) - start
+            if length <= 0:
+                length = self.GetLength() - start
+            text = self.GetLine(line)
+            style, fence = line_style(text, fence)
+            self.SetStyling(length, style)
+            self.SetLineState(line, fence)
+            line += 1
+
+    def on_modified(self, event):
+        ''' keep the ASCII shortcut right when the user edits '''
+        self.starts = None
+        if self.updating:
+            pass
+        elif event.GetModificationType() & stc.STC_MOD_INSERTTEXT:
+            if self.ascii and not event.GetText().isascii():
+                self.ascii = False
+        elif self.GetLength() == 0:
+            self.ascii = True
+        event.Skip()
+
+    # ----------------------------
+    #   Characters and bytes
+    # ----------------------------
+
+    def line_starts(self):
+        ''' character offset of each line start, then len(text) + 1 '''
+        if self.starts is None:
+            text = self.GetText()
+            self.starts = [0] + [m.end() for m in LINE_END.finditer(text)] + [len(text) + 1]
+        return self.starts
+
+    def to_byte(self, pos):
+        if self.ascii:
+            return pos
+        starts = self.line_starts()
+        if pos >= starts[-1] - 1:
+            return self.GetLength()
+        line = bisect_right(starts, pos) - 1
+        start = self.PositionFromLine(line)
+        return self.PositionRelative(start, pos - starts[line]) if pos > starts[line] else start
+
+    def to_char(self, pos):
+        if self.ascii:
+            return pos
+        line = self.LineFromPosition(pos)
+        return self.line_starts()[line] + self.CountCharacters(self.PositionFromLine(line), pos)
+
+    def to_bytes(self, ranges, text):
+        ''' (start, end) character ranges, sorted, of text (the whole
+            content) as byte ranges, in one pass over text '''
+        if self.ascii:
+            return list(ranges)
+        out = []
+        char = byte = 0
+        for start, end in ranges:
+            byte += len(text[char:start].encode("utf-8"))
+            b_end = byte + len(text[start:end].encode("utf-8"))
+            out.append((byte, b_end))
+            char, byte = end, b_end
+        return out
+
+    # ----------------------------
+    #   TextCtrl methods, in characters
+    # ----------------------------
+
+    def SetValue(self, text):
+        self.ascii = text.isascii()
+        self.updating = True
+        self.SetText(text)
+        self.updating = False
+
+    def GetValue(self):
+        return self.GetText()
+
+    def AppendText(self, text):
+        ''' add to the end, O(len(text)) '''
+        self.ascii = self.ascii and text.isascii()
+        self.updating = True
+        super(ResponseView, self).AppendText(text)
+        self.updating = False
+
+    def Replace(self, start, end, text):
+        self.SetTargetStart(self.to_byte(start))
+        self.SetTargetEnd(self.to_byte(end))
+        self.ascii = self.ascii and text.isascii()
+        self.updating = True
+        self.ReplaceTarget(text)
+        self.updating = False
+
+    def GetInsertionPoint(self):
+        return self.to_char(self.GetCurrentPos())
+
+    def SetInsertionPoint(self, pos):
+        self.GotoPos(self.to_byte(pos))
+
+    def SetInsertionPointEnd(self):
+        self.DocumentEnd()
+
+    def GetLastPosition(self):
+        return self.to_char(self.GetLength())
+
+    def SetSelection(self, start, end):
+        super(ResponseView, self).SetSelection(self.to_byte(start), self.to_byte(end))
+
+    def ShowPosition(self, pos):
+        ''' scroll pos to a third of the way down, if it is off screen '''
+        line = self.VisibleFromDocLine(self.LineFromPosition(self.to_byte(pos)))
+        top = self.GetFirstVisibleLine()
+        if not top <= line < top + self.LinesOnScreen():
+            self.SetFirstVisibleLine(max(0, line - self.LinesOnScreen() // 3))
+
+    # ----------------------------
+    #   Search matches
+    # ----------------------------
+
+    def highlight(self, ranges, text):
+        ''' mark the (start, end) character ranges of text '''
+        self.clear_highlights()
+        self.SetIndicatorCurrent(INDIC_MATCH)
+        for start, end in self.to_bytes(ranges, text):
+            self.IndicatorFillRange(start, end - start)
+
+    def clear_highlights(self):
+        self.SetIndicatorCurrent(INDIC_MATCH)
+        self.IndicatorClearRange(0, self.GetLength())
+
+
+def line_style(text, fence):
+    ''' style of one line and the fence state after it
+        fence is 0 outside code, else a number for the open fence '''
+    m = codeblocks.FENCE.match(text.rstrip("\r\n"))
+    if fence:
+        char, size = chr(fence % 1000), fence // 1000
+        if (m and m.group(2)[0] == char and len(m.group(2)) >= size
+                and not m.group(3).strip()):
+            return STYLE_FENCE, 0
+        return STYLE_CODE, fence
+    if m and not (m.group(2)[0] == "`" and "`" in m.group(3)):
+        return STYLE_FENCE, len(m.group(2)) * 1000 + ord(m.group(2)[0])
+    if text.startswith("#"):
+        return STYLE_HEADING, 0
+    if text.startswith(ROLES):
+        return STYLE_ROLE, 0
+    return STYLE_TEXT, 0
@@ -0,0 +1,170 @@
+# retry.py
+# The request layer under gptCode / gptStream: rate limits, retries
+# and hedging, shared by the GUI, compare and the batch mode.
+#   - each attempt first takes its share of the rpm/tpm token bucket
+#   - 429s, 5xx, timeouts and lost connections are retried with
+#     jittered exponential backoff, or after the wait the server asks
+#     for (Retry-After, retry-after-ms, x-ratelimit-reset-*)
+#   - a 429 pauses the whole bucket, so parallel workers back off too
+#   - hedging: a duplicate request is sent when one is far past the
+#     p95 latency of the recent ones, the first reply wins
+# The openai client is built with max_retries=0 so only this layer
+# retries.
+#
+
+import queue
+import random
+import re
+import threading
+from collections import deque
+from time import perf_counter, sleep
+
+import metrics
+
+RETRY_STATUS = (408, 409, 429, 500, 502, 503, 504)
+RETRY_ERRORS = ("APIConnectionError", "APITimeoutError")
+BACKOFF = 1.0        # seconds, the first retry waits up to this
+MAX_BACKOFF = 60.0
+HEDGE_FACTOR = 2.0   # hedge when a request takes this times the p95
+HEDGE_SAMPLES = 20   # latencies needed before hedging starts
+
+DURATION = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)?')
+DURATIONS = re.compile(r'(?:\d+(?:\.\d+)?(?:ms|h|m|s)?)+')
+UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0, None: 1.0}
+
+
+def retryable(e):
+    ''' worth another try: rate limits, server errors, lost connections '''
+    status = getattr(e, "status_code", None)
+    return status in RETRY_STATUS or type(e).__name__ in RETRY_ERRORS
+
+
+def parse_duration(text):
+    ''' seconds in "20", "1.5s", "120ms" or "6m0s", None if unknown '''
+    text = str(text).strip()
+    if not DURATIONS.fullmatch(text):
+        return None
+    found = DURATION.findall(text)
+    return sum(float(n) * UNITS[u or None] for n, u in found)
+
+
+def server_delay(e):
+    ''' the wait the server asked for in the error's headers, or None '''
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    waits = []
+    if headers.get("retry-after-ms"):
+        try:
+            waits.append(float(headers["retry-after-ms"]) / 1000)
+        except ValueError:
+            pass
+    elif headers.get("retry-after"):
+        waits.append(parse_duration(headers["retry-after"]))  # an HTTP date gives None
+    if getattr(e, "status_code", None) == 429:
+        for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+            if headers.get(name):
+                waits.append(parse_duration(headers[name]))
+    waits = [w for w in waits if w is not None]
+    return min(max(waits), MAX_BACKOFF) if waits else None
+
+
+def backoff(attempt):
+    ''' jittered exponential backoff for retry number attempt (from 1) '''
+    return random.uniform(0.1, 1.0) * min(BACKOFF * 2 ** (attempt - 1), MAX_BACKOFF)
+
+
+def call(func, retries=3, tokens=0, limiter=None, cancelled=None,
+         can_retry=None, on_retry=None):
+    ''' func() with retries
+        limiter    a ratelimit.RateLimiter, tokens is the estimate
+        cancelled  a threading.Event, stops the waits
+        can_retry  returns False when a retry would do harm
+                   (a stream that already showed text)
+        on_retry(attempt, delay, error) before each wait '''
+    attempt = 0
+    while True:
+        if limiter is not None and not limiter.acquire(tokens, cancelled):
+            return None  # cancelled while waiting
+        try:
+            return func()
+        except Exception as e:
+            attempt += 1
+            if (attempt > retries or not retryable(e)
+                    or (cancelled is not None and cancelled.is_set())
+                    or (can_retry is not None and not can_retry())):
+                raise
+            delay = server_delay(e)
+            if delay is None:
+                delay = backoff(attempt)
+            if limiter is not None and getattr(e, "status_code", None) == 429:
+                limiter.pause(delay)
+            if on_retry is not None:
+                on_retry(attempt, delay, e)
+            if cancelled is not None:
+                if cancelled.wait(delay):
+                    raise
+            else:
+                sleep(delay)
+
+
+class Attempt:
+    ''' stands in for the job in one hedged attempt (gets .usage) '''
+    def __init__(self):
+        self.usage = None
+
+
+class LatencyTracker:
+    ''' recent request latencies, to know when to hedge '''
+
+    def __init__(self, size=100):
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=size)
+
+    def add(self, seconds):
+        with self.lock:
+            self.recent.append(seconds)
+
+    def hedge_after(self):
+        ''' seconds after which to hedge, 0 while there are too few samples '''
+        with self.lock:
+            if len(self.recent) < HEDGE_SAMPLES:
+                return 0.0
+            return HEDGE_FACTOR * metrics.percentile(list(self.recent), 95)
+
+
+def hedged(func, after):
+    ''' func(attempt) -> result, a second attempt is started if the
+        first is not back after `after` seconds (0: never)
+        returns (result, the Attempt that won) '''
+    if not after:
+        first = Attempt()
+        return func(first), first
+    done = queue.Queue()
+
+    def run(attempt):
+        try:
+            done.put((attempt, func(attempt), None))
+        except Exception as e:
+            done.put((attempt, None, e))
+
+    threading.Thread(target=run, args=(Attempt(),), daemon=True).start()
+    try:
+        attempt, result, error = done.get(timeout=after)
+    except queue.Empty:
+        threading.Thread(target=run, args=(Attempt(),), daemon=True).start()
+        attempt, result, error = done.get()
+        if error is not None:
+            attempt, result, error = done.get()  # the other one may still make it
+    if error is not None:
+        raise error
+    return result, attempt
+
+
+def timed(func, tracker):
+    ''' func() and add its latency to tracker when it succeeds '''
+    t0 = perf_counter()
+    result = func()
+    tracker.add(perf_counter() - t0)
+    return result
@@ -0,0 +1,58 @@
+# searchdlg.py
+# Find dialog for the response area (Ctrl-F)
+#
+
+import wx
+
+
+class SearchDialog(wx.Dialog):
+    ''' asks for the search text and mode
+        after ShowModal: self.backward is True for "Find Previous" '''
+
+    def __init__(self, parent, search):
+        super(SearchDialog, self).__init__(parent, title="Find")
+        self.backward = False
+
+        self.query = wx.TextCtrl(self, value=search.query, size=(300, -1),
+                                 style=wx.TE_PROCESS_ENTER)
+        self.query.SelectAll()
+        self.regex = wx.CheckBox(self, label="Regex")
+        self.regex.SetValue(search.regex)
+        self.whole_word = wx.CheckBox(self, label="Whole word")
+        self.whole_word.SetValue(search.whole_word)
+        self.case = wx.CheckBox(self, label="Match case")
+        self.case.SetValue(search.case)
+        next_btn = wx.Button(self, wx.ID_OK, label="Find Next")
+        prev_btn = wx.Button(self, label="Find Previous")
+        cancel_btn = wx.Button(self, wx.ID_CANCEL)
+
+        modes = wx.BoxSizer(wx.HORIZONTAL)
+        modes.Add(self.regex, 0, wx.RIGHT, 10)
+        modes.Add(self.whole_word, 0, wx.RIGHT, 10)
+        modes.Add(self.case, 0)
+        buttons = wx.BoxSizer(wx.HORIZONTAL)
+        buttons.Add(next_btn, 0, wx.RIGHT, 5)
+        buttons.Add(prev_btn, 0, wx.RIGHT, 5)
+        buttons.Add(cancel_btn, 0)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(wx.StaticText(self, label="Enter text to search:"), 0, wx.ALL, 5)
+        sizer.Add(self.query, 0, wx.EXPAND | wx.LEFT | wx.RIGHT, 5)
+        sizer.Add(modes, 0, wx.ALL, 5)
+        sizer.Add(buttons, 0, wx.ALIGN_RIGHT | wx.ALL, 5)
+        self.SetSizerAndFit(sizer)
+
+        self.query.Bind(wx.EVT_TEXT_ENTER, lambda e: self.EndModal(wx.ID_OK))
+        prev_btn.Bind(wx.EVT_BUTTON, self.on_previous)
+        next_btn.SetDefault()
+        self.query.SetFocus()
+
+    def on_previous(self, event):
+        self.backward = True
+        self.EndModal(wx.ID_OK)
+
+    def values(self):
+        ''' arguments for TextSearch.set_query '''
+        return dict(query=self.query.GetValue(),
+                    regex=self.regex.GetValue(),
+                    whole_word=self.whole_word.GetValue(),
+                    case=self.case.GetValue())
@@ -0,0 +1,134 @@
+# sessions.py
+# Named conversations kept in sessions.db (SQLite), so a chat goes on
+# where it stopped after a restart. Each turn is written as it
+# happens: one row per message, keyed by (session, seq). Opening a
+# session reads only its newest messages; older ones are read a
+# chunk at a time when they are needed, so startup and switching
+# cost the same however long a session has grown.
+#
+
+import sqlite3
+from time import localtime, strftime, time
+
+DB_FILE = "sessions.db"
+LOAD_MESSAGES = 40  # messages read when a session is opened
+MORE_MESSAGES = 100  # messages read each time older ones are needed
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions(
+    id INTEGER PRIMARY KEY, name TEXT UNIQUE, role TEXT,
+    created REAL, updated REAL, messages INTEGER DEFAULT 0,
+    summary TEXT DEFAULT '', summary_upto INTEGER DEFAULT 0);
+CREATE TABLE IF NOT EXISTS turns(
+    session INTEGER, seq INTEGER, ts REAL, role TEXT, model TEXT, content TEXT,
+    PRIMARY KEY(session, seq)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions(updated);
+'''
+
+
+class Session:
+    ''' one named conversation and the part of it loaded '''
+    def __init__(self, row):
+        (self.id, self.name, self.role, self.created, self.updated,
+         self.messages, self.summary, self.summary_upto) = row
+        self.first = self.messages  # seq of the oldest message loaded
+
+    def describe(self):
+        day = strftime("%d %b %Y %H:%M", localtime(self.updated))
+        return f"{self.name}   ({self.messages} messages, {day})"
+
+
+class SessionStore:
+    def __init__(self, path=DB_FILE):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def _get(self, where, args=()):
+        row = self.db.execute(
+            "SELECT id, name, role, created, updated, messages, summary, summary_upto "
+            "FROM sessions " + where, args).fetchone()
+        return Session(row) if row else None
+
+    def latest(self):
+        return self._get("ORDER BY updated DESC LIMIT 1")
+
+    def get(self, session_id):
+        return self._get("WHERE id = ?", (session_id,))
+
+    def create(self, name, role):
+        ''' a new empty session, the name made unique '''
+        base, n = name, 1
+        while self.db.execute("SELECT 1 FROM sessions WHERE name = ?", (name,)).fetchone():
+            n += 1
+            name = f"{base} ({n})"
+        now = time()
+        cur = self.db.execute(
+            "INSERT INTO sessions(name, role, created, updated) VALUES(?, ?, ?, ?)",
+            (name, role, now, now))
+        self.db.commit()
+        return self.get(cur.lastrowid)
+
+    def list(self):
+        ''' all sessions, the most recently used first '''
+        rows = self.db.execute(
+            "SELECT id, name, role, created, updated, messages, summary, summary_upto "
+            "FROM sessions ORDER BY updated DESC").fetchall()
+        return [Session(r) for r in rows]
+
+    def rename(self, session, name):
+        self.db.execute("UPDATE sessions SET name = ? WHERE id = ?", (name, session.id))
+        self.db.commit()
+        session.name = name
+
+    def delete(self, session):
+        self.db.execute("DELETE FROM turns WHERE session = ?", (session.id,))
+        self.db.execute("DELETE FROM sessions WHERE id = ?", (session.id,))
+        self.db.commit()
+
+    def load_tail(self, session, n=LOAD_MESSAGES):
+        ''' the newest n messages (oldest first), a whole exchange
+            at the start (never an assistant without its prompt) '''
+        return self.load_older(session, n)
+
+    def load_older(self, session, n=MORE_MESSAGES):
+        ''' the n messages before the ones loaded, oldest first '''
+        rows = self.db.execute(
+            "SELECT seq, role, content FROM turns WHERE session = ? AND seq < ? "
+            "ORDER BY seq DESC LIMIT ?", (session.id, session.first, n)).fetchall()
+        rows.reverse()
+        while rows and rows[0][1] == "assistant" and rows[0][0] > 0:
+            rows.pop(0)  # its prompt is in the next chunk
+        if rows:
+            session.first = rows[0][0]
+        return [{"role": role, "content": content} for seq, role, content in rows]
+
+    def append(self, session, messages, model=""):
+        ''' write the new messages of a turn '''
+        now = time()
+        rows = []
+        for msg in messages:
+            rows.append((session.id, session.messages, now, msg["role"],
+                         model if msg["role"] == "assistant" else "", msg["content"]))
+            session.messages += 1
+        self.db.executemany("INSERT OR REPLACE INTO turns VALUES(?, ?, ?, ?, ?, ?)", rows)
+        self.db.execute("UPDATE sessions SET messages = ?, updated = ? WHERE id = ?",
+                        (session.messages, now, session.id))
+        self.db.commit()
+        session.updated = now
+
+    def set_role(self, session, role):
+        session.role = role
+        self.db.execute("UPDATE sessions SET role = ? WHERE id = ?", (role, session.id))
+        self.db.commit()
+
+    def set_summary(self, session, summary, upto):
+        ''' the running summary covers messages with seq < upto '''
+        session.summary, session.summary_upto = summary, upto
+        self.db.execute("UPDATE sessions SET summary = ?, summary_upto = ? WHERE id = ?",
+                        (summary, upto, session.id))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
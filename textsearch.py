@@ -0,0 +1,91 @@
+# textsearch.py
+# Search engine for the response area.
+# The text is taken (and lowercased) once per content change and
+# all matches of a query are found in one pass, so stepping to the
+# next or previous match is O(1). Supports plain text, regex,
+# whole word and case-sensitive searches.
+#
+
+import re
+from bisect import bisect_left
+
+
+class TextSearch:
+    def __init__(self):
+        self.text = ""
+        self.lower = None    # lowercase shadow of text, made on demand
+        self.query = ""
+        self.regex = False
+        self.whole_word = False
+        self.case = False
+        self.pattern = None
+        self.found = None    # list of (start, end), made on demand
+        self.starts = []
+        self.current = None  # index in found of the selected match
+
+    def set_text(self, text):
+        ''' new content: old matches are no longer valid '''
+        self.text = text
+        self.lower = None
+        self.found = None
+        self.current = None
+
+    def set_query(self, query, regex=False, whole_word=False, case=False):
+        ''' returns an error message for a bad regex, else None '''
+        source = query if regex else re.escape(query)
+        if whole_word:
+            source = r"\b(?:" + source + r")\b"
+        try:
+            self.pattern = re.compile(source, 0 if case else re.IGNORECASE)
+        except re.error as e:
+            return f"Bad pattern: {e}"
+        self.query = query
+        self.regex, self.whole_word, self.case = regex, whole_word, case
+        self.found = None
+        self.current = None
+        return None
+
+    def matches(self):
+        ''' all (start, end) of the query in the text '''
+        if self.found is None:
+            self.found = self._find_all() if self.query else []
+            self.starts = [m[0] for m in self.found]
+        return self.found
+
+    def _find_all(self):
+        if self.regex or self.whole_word or self.case:
+            return [m.span() for m in self.pattern.finditer(self.text)
+                    if m.end() > m.start()]
+        # plain case-insensitive: str.find on the lowercase shadow
+        if self.lower is None:
+            self.lower = self.text.lower()
+        if len(self.lower) != len(self.text):
+            # lowercasing changed lengths, offsets would not match
+            return [m.span() for m in self.pattern.finditer(self.text)]
+        needle = self.query.lower()
+        found = []
+        n = len(needle)
+        i = self.lower.find(needle)
+        while i != -1:
+            found.append((i, i + n))
+            i = self.lower.find(needle, i + n)
+        return found
+
+    def step(self, pos, backward=False):
+        ''' the next (or previous) match, wrapping around
+            pos is only used for the first step after a change '''
+        found = self.matches()
+        if not found:
+            return None
+        if self.current is None:
+            i = bisect_left(self.starts, pos)
+            self.current = (i - 1 if backward else i) % len(found)
+        else:
+            self.current = (self.current + (-1 if backward else 1)) % len(found)
+        return found[self.current]
+
+    def position(self):
+        ''' "n of total" for the selected match '''
+        if self.current is None:
+            return ""
+        return f"{self.current + 1} of {len(self.found)}"
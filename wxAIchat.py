@@ -6,46 +6,113 @@
 # Requires an OpenAI registration 'key'
 # Uses 'mpv' for voice playback on Linux
 #
+# openai and markdown are imported when first needed
+# so the window shows without waiting for them
+#
+from time import perf_counter, strftime
+T_START = perf_counter()
 import os
-import sys
 import iniproc
-import markdown
-import webbrowser
 import wx
-import platform
 import subprocess
 import openvoc
-from time import localtime, strftime
-from openai import OpenAI
-
-opts = [] # loading options from the options.ini file into a list
-opts = iniproc.read("options.ini", 'openai',    # 0
-                                   'model',     # 1
-                                   'fontsz1',   # 2
-                                   'fontsz2',   # 3
-                                   'role',      # 4
-                                   'log',       # 5
-                                   'editor',    # 6
-                                   'qheight',   # 7
-                                   'font1',     # 8
-                                   'font2',     # 9
-                                   'voice')     # 10
-intro = f'''
+import reqworker
+import aiclient
+import context
+import chatlog
+import history
+import historydlg
+import logview
+import respcache
+import attach
+import sessions
+import searchdlg
+import textsearch
+import codeblocks
+import mdrender
+import responseview
+import pricing
+import metrics
+import ratelimit
+import retry
+import threading
+import json
+import sqlite3
+import sys
+from collections import deque
+
+# every option with its default, the type of the default
+# is the type the value is converted to
+DEFAULTS = {
+    'openai': 'OPENAI_API_KEY',  # env variable holding the key
+    'model': 'gpt-4.1-mini',
+    'role': 'you are a helpful assistant.',
+    'log': True,
+    'fontsz1': 11,
+    'font1': '',
+    'fontsz2': 10,
+    'font2': '',
+    'editor': 'mousepad',
+    'qheight': 200,
+    'voice': 'alloy',
+    'stream': True,
+    'pool_size': 4,
+    'timeout': 60.0,
+    'warmup': True,
+    'max_context': 16000,
+    'context': 'window',
+    'cache': 'off',
+    'cache_size': 50.0,
+    'cache_ttl': 168.0,
+    'models': 'gpt-4.1-mini, gpt-4.1-nano',
+    'compare_workers': 3,
+    'job_workers': 3,
+    'batch_workers': 4,
+    'rpm': 0,
+    'tpm': 0,
+    'retries': 3,
+    'metrics': True,
+    'hedge': False,
+    'attach_tokens': 4000,
+}
+
+def load_options():
+    ''' load options from the options.ini file into a dictionary '''
+    return iniproc.load("options.ini", DEFAULTS)
+
+opts = load_options()
+
+# sessions shown per page in the log viewer
+VIEW_SESSIONS = 5
+VIEW_MORE = "[PageUp at the top shows earlier sessions]\n"
+# most search matches highlighted at once
+MAX_HIGHLIGHT = 2000
+
+def intro_text():
+    ''' welcome text with the current options '''
+    return f'''
 Welcome to wxAIchat
     a GUI desktop AI client for conversing with
     OpenAI's Large Language Models
 
-Model: {opts[1]}
-role: {opts[4]}
-OpenAI Key: {opts[0]}
-log: {opts[5]}
-qheight: {opts[7]}
-editor: {opts[6]}
-voice: {opts[10]}
-font1: {opts[8]}
-f1 size: {opts[2]}
-font2: {opts[9]}
-f2 size: {opts[3]}
+Model: {opts['model']}
+role: {opts['role']}
+OpenAI Key: {opts['openai']}
+log: {'on' if opts['log'] else 'off'}
+qheight: {opts['qheight']}
+editor: {opts['editor']}
+voice: {opts['voice']}
+stream: {'on' if opts['stream'] else 'off'}
+pool_size: {opts['pool_size']}
+timeout: {opts['timeout']}
+warmup: {'on' if opts['warmup'] else 'off'}
+max_context: {opts['max_context']}
+context: {opts['context']}
+cache: {opts['cache']}
+font1: {opts['font1']}
+f1 size: {opts['fontsz1']}
+font2: {opts['font2']}
+f2 size: {opts['fontsz2']}
 
 A registered OpenAI API key is required
 and set as a system environment variable
@@ -55,12 +122,94 @@ wxpython and openai modules also required
 Use Ctrl-H for list of keyboard commands
 '''
 
+def request_options(timeout=None, cache_key=None):
+    """Per-request options: timeout (seconds) overrides the client's,
+    cache_key (prompt_cache_key) sends requests that share a prefix to
+    the same prompt cache."""
+    extra = {}
+    if timeout:
+        extra["timeout"] = timeout
+    if cache_key:
+        extra["extra_body"] = {"prompt_cache_key": cache_key}
+    return extra
+
+def gptCode(key: str, model: str, messages: str, job=None, timeout=None,
+            cache_key=None) -> str:
+    """Call the OpenAI ChatCompletion endpoint.
+       Used by the GUI and by the batch mode.
+       messages keep the role and the history first and unchanged, so
+       the API serves that prefix from its prompt cache."""
+    client = aiclient.get_client(key)
+    resp = client.chat.completions.create(
+    model    = model,
+    messages = messages,
+    **request_options(timeout, cache_key))
+    if job is not None:
+        job.usage = resp.usage
+    return resp.choices[0].message.content.strip()
+
+def gptStream(key: str, model: str, messages: str, job, timeout=None,
+              cache_key=None) -> str:
+    """Call the OpenAI ChatCompletion endpoint with stream=True.
+    Deltas are handed to the job as they arrive."""
+    reply = []
+    client = aiclient.get_client(key)
+    stream = client.chat.completions.create(
+    model    = model,
+    messages = messages,
+    stream   = True,
+    stream_options = {"include_usage": True},
+    **request_options(timeout, cache_key))
+    job.on_cancel(stream.close)  # Stop closes the connection at once
+    for chunk in stream:
+        if job.is_cancelled():
+            stream.close()
+            break
+        if chunk.usage is not None:
+            job.usage = chunk.usage  # comes with the last chunk
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            reply.append(delta)
+            job.emit(delta)
+    return "".join(reply).strip()
+
+def run_batch(argv):
+    ''' headless batch mode, no display needed:
+        python wxAIchat.py --batch prompts.jsonl [-o results.jsonl] '''
+    import argparse
+    import batch
+    parser = argparse.ArgumentParser(prog="wxAIchat.py --batch",
+                                     description="Run a file of prompts, one reply each")
+    parser.add_argument("prompts", help="JSONL ({\"id\", \"prompt\"}) or text file, one prompt per line")
+    parser.add_argument("-o", "--out", help="JSONL results, appended (default <prompts>.out.jsonl)")
+    parser.add_argument("--model", default=opts['model'])
+    parser.add_argument("--workers", type=int, default=opts['batch_workers'])
+    parser.add_argument("--rpm", type=int, default=opts['rpm'], help="requests per minute, 0 no limit")
+    parser.add_argument("--tpm", type=int, default=opts['tpm'], help="tokens per minute, 0 no limit")
+    parser.add_argument("--retries", type=int, default=opts['retries'])
+    args = parser.parse_args(argv)
+    out = args.out or os.path.splitext(args.prompts)[0] + ".out.jsonl"
+
+    aiclient.configure(opts['openai'], max(opts['pool_size'], args.workers), opts['timeout'])
+    log = chatlog.ChatLog() if opts['log'] else None
+    runner = batch.BatchRunner(gptCode, opts['openai'], args.model, opts['role'], out,
+                               workers=args.workers,
+                               limiter=ratelimit.RateLimiter(args.rpm, args.tpm),
+                               retries=args.retries, log=log)
+    failed = runner.run(batch.read_prompts(args.prompts))[1]
+    if log is not None:
+        log.close()
+    return 1 if failed else 0
+
 class MyFrame(wx.Frame):
-    def __init__(self, parent, title="wxAI V1.1 OpenAI " + opts[1]):
+    def __init__(self, parent, title="wxAI V1.1 OpenAI " + opts['model']):
         super(MyFrame, self).__init__(parent, title=title, size=(600, 550))
 
         panel = wx.Panel(self)
         sizer = wx.GridBagSizer(5, 5)
+        self.sizer = sizer
         self.playback = False
 
         # ----------------------------
@@ -71,11 +220,11 @@ class MyFrame(wx.Frame):
         sizer.Add(
             self.text1,
             pos=(0, 0),              # Position at row 0, column 0
-            span=(1, 5),             # Span of 1 row and 2 columns
+            span=(1, 6),             # Span of 1 row and 2 columns
             flag=wx.ALL | wx.EXPAND, # Allow horizontal expansion
             border=5
         )
-        sizer.SetItemMinSize(self.text1, self.text1.GetSize().GetWidth(), int(opts[7]))  # Height
+        sizer.SetItemMinSize(self.text1, self.text1.GetSize().GetWidth(), opts['qheight'])  # Height
         self.text1.Bind(wx.EVT_KEY_DOWN, self.on_key_down_hotkeys)
         self.text1.SetToolTip("Enter Prompt in this field")
         self.text1.SetFocus()
@@ -84,16 +233,17 @@ class MyFrame(wx.Frame):
         # Second Text Widget (text2) the response area
         # ----------------------------
         # This TextCtrl will expand both horizontally and vertically
-        self.text2 = wx.TextCtrl(panel, style=wx.TE_MULTILINE)  # wx.TE_DONTWRAP
+        self.text2 = responseview.ResponseView(panel)  # handles multi-MB replies and logs
         sizer.Add(
             self.text2,
             pos=(1, 0),              # Position at row 1, column 0
-            span=(1, 5),             # Span of 1 row and 2 columns
+            span=(1, 6),             # Span of 1 row and 2 columns
             flag=wx.ALL | wx.EXPAND, # Allow horizontal expansion
             border=5
         )
         self.text2.Bind(wx.EVT_KEY_DOWN, self.on_key_down_hotkeys)
-        self.text2.SetValue(intro)
+        self.text2.Bind(wx.stc.EVT_STC_CHANGE, self.on_text2_changed)
+        self.text2.SetValue(intro_text())
 
         # ----------------------------
         # Clear Button
@@ -129,6 +279,7 @@ class MyFrame(wx.Frame):
         # View Button
         # ----------------------------
         view_btn = wx.Button(panel, label="View Log")
+        self.view_btn = view_btn
         sizer.Add(
             view_btn,
             pos=(2, 2),          # Position at row 2, column 0
@@ -143,6 +294,7 @@ class MyFrame(wx.Frame):
         # Submit Button
         # ----------------------------
         submit_btn = wx.Button(panel, label="Submit")
+        self.submit_btn = submit_btn
         sizer.Add(
             submit_btn,
             pos=(2, 3),          # Position at row 2, column 0
@@ -150,22 +302,37 @@ class MyFrame(wx.Frame):
             flag=wx.EXPAND | wx.ALL, # Align to bottom-right
             border=5  # behaves like a "margin"
         )
-        submit_btn.SetToolTip(f"Submit prompt to {opts[1]} (Ctrl-G)")
+        submit_btn.SetToolTip(f"Submit prompt to {opts['model']} (Ctrl-G)")
         submit_btn.Bind(wx.EVT_BUTTON, self.on_submit)
 
+        # ----------------------------
+        # Stop Button
+        # ----------------------------
+        self.stop_btn = wx.Button(panel, label="Stop")
+        sizer.Add(
+            self.stop_btn,
+            pos=(2, 4),          # Position at row 2, column 0
+            span=(1, 1),         # Span of 1 row and 1 column
+            flag=wx.EXPAND | wx.ALL, # Align to bottom-right
+            border=5  # behaves like a "margin"
+        )
+        self.stop_btn.Bind(wx.EVT_BUTTON, self.on_stop)
+        self.stop_btn.SetToolTip("Cancel the running request (Esc)")
+        self.stop_btn.Enable(False)
+
         # ----------------------------
         # Close Button
         # ----------------------------
         close_btn = wx.Button(panel, label="Close")
         sizer.Add(
             close_btn,
-            pos=(2, 4),          # Position at row 2, column 0
+            pos=(2, 5),          # Position at row 2, column 0
             span=(1, 1),         # Span of 1 row and 1 column
             flag=wx.EXPAND | wx.ALL, # Align to bottom-right
             border=5  # behaves like a "margin"
         )
         # Bind the close button event to the handler
-        close_btn.Bind(wx.EVT_BUTTON, self.on_close)
+        close_btn.Bind(wx.EVT_BUTTON, lambda e: self.Close())
         close_btn.SetToolTip("Ctrl-Q")
 
 
@@ -177,10 +344,16 @@ class MyFrame(wx.Frame):
         sizer.AddGrowableCol(2, 1)    # Export button grows horizontally
         sizer.AddGrowableCol(3, 1)    #
         sizer.AddGrowableCol(4, 1)    #
+        sizer.AddGrowableCol(5, 1)    #
         sizer.AddGrowableRow(1, 1)    #
 
         panel.SetSizer(sizer)
 
+        # ----------------------------
+        # Status bar shows request timings and tokens sent
+        # ----------------------------
+        self.CreateStatusBar(2)
+
         #----------------------------
         # set window metrics from winfo file
         # ----------------------------
@@ -193,68 +366,225 @@ class MyFrame(wx.Frame):
             self.SetPosition(position)
             self.SetSize(wx.Size(w, h))
 
-        #----------------------------
-        # SET CUSTOM FONTS
-        # https://docs.wxpython.org/wx.FontInfo.html#wx-fontinfo
-        # https://docs.wxpython.org/wx.FontFamily.enumeration.html#wx-fontfamily
-        if platform.system() == "Windows":
-            custom_font1 = wx.Font(
-                        int(opts[2]),
-                        wx.FONTFAMILY_DEFAULT,
-                        wx.FONTSTYLE_NORMAL,
-                        wx.FONTWEIGHT_NORMAL,
-                        False,
-                        opts[8]
-            )
-            self.text1.SetFont(custom_font1)
-
-            custom_font2 = wx.Font(
-                        int(opts[3]),           # Font size
-                        wx.FONTFAMILY_DEFAULT,  # Font family: MODERN is typically monospaced
-                        wx.FONTSTYLE_NORMAL,    # Font style
-                        wx.FONTWEIGHT_NORMAL,   # Font weight
-                        False,                  # Underlined
-                        opts[9]                 # Face name
-            )
-            self.text2.SetFont(custom_font2)
-        else:  # not Windows ...
-            custom_font1 = wx.Font(
-                        int(opts[2]),
-                        wx.FONTFAMILY_DEFAULT,
-                        wx.FONTSTYLE_NORMAL,
-                        wx.FONTWEIGHT_NORMAL,
-                        False,
-                        opts[8]
-            )
-            self.text1.SetFont(custom_font1)
-
-            custom_font2 = wx.Font(
-                        int(opts[3]),           # Font size
-                        wx.FONTFAMILY_DEFAULT,  # Font family: MODERN is typically monospaced
-                        wx.FONTSTYLE_NORMAL,    # Font style
-                        wx.FONTWEIGHT_NORMAL,   # Font weight
-                        False,                  # Underlined
-                        opts[9]                 # Face name
-            )
-            self.text2.SetFont(custom_font2)
-
-        # DISABLE View Log if not set to 'on'
-        if opts[5] == "off":
-            view_btn.Enable(False)
-            view_btn.SetToolTip("Log is 'off'")
-        else:
-            view_btn.SetToolTip("View past queries")
+        self.set_fonts()
 
         # Variables to store search state
-        self.search_text = ""
-        self.search_pos = 0
+        self.search = textsearch.TextSearch()
+        self.search_dirty = True  # text2 changed since the last search
+        self.highlighted = False  # the matches of the query are marked
+
+        # code blocks of the response, kept up to date as it streams
+        self.codes = codeblocks.CodeIndex()
+        self.codes_dirty = True  # text2 changed other than by streaming
+
+        # rendered Markdown fragments, shared by preview and export
+        self.renderer = mdrender.RenderCache()
+        self.preview = None
+
+        # background requests: one thread for chat, one for voice,
+        # one to read attached files
+        self.worker = reqworker.Executor(self)
+        self.voice_worker = reqworker.Executor(self)
+        self.file_worker = reqworker.Executor(self)
+        self.attachments = attach.Attachments()
+        self.chat_job = None         # request in flight
+        self.speech = None           # speaks the reply as it streams in
+        self.prompt_queue = deque()  # prompts waiting for it
+        self.failed = deque()        # prompts whose request failed
+        self.Bind(reqworker.EVT_STREAM, self.on_stream)
+        self.Bind(reqworker.EVT_RESULT, self.on_result)
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+
+        # one pooled client shared by chat and voice
+        self.configure_client()
+        # client-side rpm/tpm limits, and latencies for hedging
+        self.limiter = ratelimit.RateLimiter(opts['rpm'], opts['tpm'])
+        self.latency = retry.LatencyTracker()
 
         # initial conversation buffer
         self.conversation = [
-            {"role": "system", "content": opts[4]}
+            {"role": "system", "content": opts['role']}
         ]
+        # append-only log, written on a background thread
+        self.session = chatlog.new_session_id()
+        self.logged_role = False
+        self.chatlog = None
+        self.history = None
+        self.set_log()
+
+        self.pager = None  # log viewer, while the log is shown
+
+        # opt-in reply cache
+        self.cache = None
+        self.set_cache()
+
+        # keeps each request inside the max_context token budget
+        self.context = context.ContextManager(opts['max_context'], opts['context'])
+
+        # named conversations in sessions.db, the last one is
+        # opened again once the window is up
+        self.sessions = sessions.SessionStore()
+        self.named_session = None
+
+        # $ per 1M tokens, for the cost figures
+        self.prices = pricing.load_prices()
+        self.compare = None  # compare window, while open
+        self.job_panel = None  # made on first use, then hidden and shown
+
+        # timings, tokens and cost of each request (metrics.jsonl)
+        self.metrics = None
+        self.set_metrics()
+
+        # apply options.ini changes while running
+        self.options_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_options_timer, self.options_timer)
+        self.options_timer.Start(1000)
 
         self.Show()
+        wx.CallAfter(self.after_show)
+
+    def after_show(self):
+        ''' runs once the window is up: load the client
+            in the background (and open a connection) '''
+        if opts['warmup']:
+            aiclient.warm_up()
+        else:
+            aiclient.preload()
+        self.open_session(self.sessions.latest())
+
+    # ----------------------------
+    #   Options, applied at start and on each options.ini change
+    # ----------------------------
+
+    def set_fonts(self):
+        ''' SET CUSTOM FONTS
+        https://docs.wxpython.org/wx.FontInfo.html#wx-fontinfo
+        https://docs.wxpython.org/wx.FontFamily.enumeration.html#wx-fontfamily '''
+        custom_font1 = wx.Font(
+                    opts['fontsz1'],
+                    wx.FONTFAMILY_DEFAULT,
+                    wx.FONTSTYLE_NORMAL,
+                    wx.FONTWEIGHT_NORMAL,
+                    False,
+                    opts['font1']
+        )
+        self.text1.SetFont(custom_font1)
+
+        custom_font2 = wx.Font(
+                    opts['fontsz2'],        # Font size
+                    wx.FONTFAMILY_DEFAULT,  # Font family: MODERN is typically monospaced
+                    wx.FONTSTYLE_NORMAL,    # Font style
+                    wx.FONTWEIGHT_NORMAL,   # Font weight
+                    False,                  # Underlined
+                    opts['font2']           # Face name
+        )
+        self.text2.SetFont(custom_font2)
+
+    def configure_client(self):
+        ''' the shared client is only rebuilt if these changed '''
+        aiclient.configure(opts['openai'],
+                           pool_size=opts['pool_size'],
+                           timeout=opts['timeout'])
+
+    def set_log(self):
+        ''' start or stop the log and history index '''
+        if opts['log'] and self.chatlog is None:
+            try:
+                imported = chatlog.import_old_log()  # before the writer starts
+            except OSError as e:
+                print("Log Import Error:", e)
+                imported = 0
+            self.chatlog = chatlog.ChatLog()
+            try:
+                self.history = history.HistoryIndex()
+            except Exception as e:  # no FTS5 in this sqlite build
+                print("History Error:", e)
+            else:
+                if imported:
+                    self.history.reset()  # the log was rewritten in front
+                # catch up with the log, then follow each write
+                threading.Thread(target=self.history.sync, daemon=True).start()
+                self.chatlog.listeners.append(self.history.sync)
+        elif not opts['log'] and self.chatlog is not None:
+            self.chatlog.close()
+            self.chatlog = None
+            self.history = None
+        # DISABLE View Log if not set to 'on'
+        if opts['log']:
+            self.view_btn.Enable(True)
+            self.view_btn.SetToolTip("View past queries")
+        else:
+            self.view_btn.Enable(False)
+            self.view_btn.SetToolTip("Log is 'off'")
+
+    def set_metrics(self):
+        ''' start or stop writing metrics.jsonl, for chat and voice '''
+        if opts['metrics'] and self.metrics is None:
+            self.metrics = metrics.Metrics(self.session)
+            openvoc.on_metric = self.metrics.add
+        elif not opts['metrics'] and self.metrics is not None:
+            openvoc.on_metric = None
+            self.metrics.close()
+            self.metrics = None
+
+    def set_cache(self):
+        ''' open (or drop) the reply cache '''
+        if self.cache is not None:
+            self.cache.db.close()
+            self.cache = None
+        if opts['cache'].lower() in ("on", "clear"):
+            self.cache = respcache.ResponseCache(
+                max_bytes=int(opts['cache_size'] * 1_000_000),
+                ttl=int(opts['cache_ttl'] * 3600))
+            if opts['cache'].lower() == "clear":
+                self.cache.clear()
+
+    def on_options_timer(self, event):
+        ''' reload options.ini when it was saved '''
+        if iniproc.changed("options.ini"):
+            try:
+                new = load_options()
+            except Exception as e:
+                self.SetStatusText(f"options.ini: {e}")
+                return
+            self.prices = pricing.load_prices()
+            self.apply_options(new)
+
+    def apply_options(self, new):
+        ''' switch to new options, keeping the conversation '''
+        global opts
+        old, opts = opts, new
+        changed = {k for k in new if new[k] != old[k]}
+        if not changed:
+            return
+        if 'model' in changed:
+            self.SetTitle("wxAI V1.1 OpenAI " + opts['model'])
+            self.submit_btn.SetToolTip(f"Submit prompt to {opts['model']} (Ctrl-G)")
+        if 'role' in changed:
+            # the role is pinned as the first message
+            self.conversation[0] = {"role": "system", "content": opts['role']}
+            self.sessions.set_role(self.named_session, opts['role'])
+            self.logged_role = False
+        if changed & {'font1', 'fontsz1', 'font2', 'fontsz2'}:
+            self.set_fonts()
+        if 'qheight' in changed:
+            self.sizer.SetItemMinSize(self.text1, self.text1.GetSize().GetWidth(), opts['qheight'])
+            self.sizer.Layout()
+        if changed & {'openai', 'pool_size', 'timeout'}:
+            self.configure_client()
+        if 'log' in changed:
+            self.set_log()
+        if changed & {'cache', 'cache_size', 'cache_ttl'}:
+            self.set_cache()
+        if 'metrics' in changed:
+            self.set_metrics()
+        if changed & {'rpm', 'tpm'}:
+            self.limiter = ratelimit.RateLimiter(opts['rpm'], opts['tpm'])
+        if changed & {'max_context', 'context'}:
+            self.context.budget = opts['max_context']
+            self.context.strategy = opts['context']
+            self.context.window_start = 1  # cut again for the new budget
+        self.SetStatusText("Options changed: " + ", ".join(sorted(changed)))
 
 
     # ----------------------------
@@ -262,7 +592,7 @@ class MyFrame(wx.Frame):
     # ----------------------------
 
     def on_close(self, event):
-        ''' Event handler for the Close button.'''
+        ''' Event handler for closing the window (Close button, Ctrl-Q, title bar).'''
         # save Window metrics
         pos = self.GetPosition()
         x, y = str(pos[0]), str(pos[1])
@@ -270,7 +600,19 @@ class MyFrame(wx.Frame):
         w, h = str(size[0]), str(size[1])
         with open("winfo", "w") as fout:
             fout.write(x + "|" + y + "|" + w + "|" + h)
-        self.Close()
+        self.options_timer.Stop()
+        self.worker.shutdown()
+        self.voice_worker.shutdown()
+        self.file_worker.shutdown()
+        if self.job_panel is not None:
+            self.job_panel.executor.shutdown()
+        self.stop_speech()
+        if self.chatlog is not None:
+            self.chatlog.close()
+        if self.metrics is not None:
+            self.metrics.close()
+        self.sessions.close()
+        event.Skip()
 
 
     def on_clear(self, event):
@@ -285,14 +627,17 @@ class MyFrame(wx.Frame):
         dlg.Destroy()
 
         if result == wx.ID_YES:
+            self.close_pager()
             self.text1.SetValue("")
-            self.text2.SetValue(intro)
+            self.text2.SetValue(intro_text())
 
 
     def on_export(self, event):
         ''' convert MD file to HTML file and open in default browser '''
+        import webbrowser
         mdtext = self.text2.GetValue()
-        htmlText = markdown.markdown(mdtext, extensions=['tables', 'fenced_code'])
+        # rendered whole, from the cache if the preview has shown it
+        htmlText = mdrender.page(self.renderer.render(mdtext))
         htmlFile = "exported.html"
         # open in default browser
         with open(htmlFile, 'w', encoding='utf-8') as file:
@@ -302,96 +647,558 @@ class MyFrame(wx.Frame):
     def on_view(self, event):
         ''' view the current log
             if set to "on" in options '''
-        with open("log.md", "r", encoding='utf-8') as fin:
-            self.text2.SetValue(fin.read())
+        self.chatlog.sync()  # write out what is queued
+        self.close_pager()
+        self.pager = logview.LogPager()
+        text = self.pager.earlier(VIEW_SESSIONS)
+        if not self.pager.at_start():
+            text = VIEW_MORE + text
+        self.text2.SetValue(text)
         self.text2.SetFocus()
         self.text2.SetInsertionPointEnd()
 
-    def on_submit(self, event):
-        ''' Event handler for Submit button (Ctrl-G). '''
-        self.text2.SetValue("Thinking ...")
-        wx.Yield()
+    def view_earlier(self):
+        ''' put the previous page of sessions above the log shown '''
+        if self.pager is None or self.pager.at_start():
+            return
+        text = self.pager.earlier(VIEW_SESSIONS)
+        if not self.pager.at_start():
+            text = VIEW_MORE + text
+        self.text2.Replace(0, len(VIEW_MORE), text)
+        self.text2.SetInsertionPoint(len(text))
+        self.text2.ShowPosition(len(text))
+
+    def close_pager(self):
+        if self.pager is not None:
+            self.pager.close()
+            self.pager = None
+
+    def on_export_log(self):
+        ''' write the whole log to log.export.md '''
+        if self.chatlog is None:
+            return
+        self.chatlog.sync()
+        path = chatlog.export_markdown()
+        self.SetStatusText(f"Log exported to {path}")
+
+    def on_submit(self, event, use_cache=True):
+        ''' Event handler for Submit button (Ctrl-G).
+            A prompt sent while a request is running is queued.
+            use_cache=False (Shift-Ctrl-G) skips the reply cache. '''
         query = self.text1.GetValue()
+        if query.strip() == "":
+            return  # nothing to send (or already sent)
+        self.text1.SetValue("")
+        if self.chat_job is not None:
+            self.prompt_queue.append((query, use_cache))
+            self.SetStatusText(f"{len(self.prompt_queue)} prompt(s) queued")
+            return
+        self.start_chat(query, use_cache)
+
+    def start_chat(self, query, use_cache=True):
+        ''' send one prompt to the chat worker '''
+        self.close_pager()
+        self.text2.SetValue("Thinking ...")
 
         # 1) add the user message
         self.conversation.append(
             {"role": "user", "content": query}
         )
 
-        # 2) call the chat completion
-        ai_text = self.gptCode(opts[0], opts[1], self.conversation)
+        # 2) fit the conversation into the token budget
+        plan = self.context.plan(self.conversation)
+        while self.needs_older(plan):
+            self.load_older()
+            plan = self.context.plan(self.conversation)
+        note = f"{plan.tokens} tokens sent"
+        if self.attachments:
+            plan, sent, refs = self.attach_files(plan)
+            note = f"{plan.tokens} tokens sent, {len(sent)} file chunks ({len(refs)} sent before)"
+        if plan.dropped:
+            note += f", {len(plan.dropped)} older messages left out"
+        self.SetStatusText(note, 1)
+
+        # speak the reply while it arrives, if voice is on
+        self.stop_speech()
+        if self.playback is True:
+            self.speech = openvoc.SpeechPipeline(opts['voice'], on_error=self.on_speech_error)
+
+        # 3) call the chat completion on the worker thread
+        job = reqworker.Job("chat", self.chat_request, opts['openai'], opts['model'], plan)
+        job.query = query
+        job.text = ""  # the reply so far, while streaming
+        job.summary = None
+        job.cache_key = None
+        if self.cache is not None:
+            job.cache_key = respcache.cache_key(opts['model'], context.messages(plan))
+            reply = self.cache.get(job.cache_key) if use_cache else None
+            if reply is not None:
+                # answered from the cache, no request needed
+                job.cache_key = None
+                self.chat_job = job
+                self.SetStatusText("Cached reply   " + self.cache.stats())
+                self.finish_chat(job, reply, None)
+                return
+        self.chat_job = self.worker.submit(job)
+        self.stop_btn.Enable(True)
+
+    def attach_files(self, plan):
+        ''' put the attached files into the last user message, chunks
+            the plan still carries from an earlier turn are only named '''
+        user = self.conversation[-1]
+        query = user["content"]
+        for _ in range(2):
+            user["content"], sent, refs = self.attachments.compose(
+                query, plan.tail[:-1], opts['attach_tokens'])
+            plan = self.context.plan(self.conversation)
+            carried = {id(m) for m in plan.tail}
+            if all(id(m) in carried for m in refs):
+                break  # else the cut moved past them: send them again
+        self.attachments.mark_sent(user, sent)
+        return plan, sent, refs
 
-        if ai_text == "":
+    def chat_request(self, job, key, model, plan):
+        ''' runs on the worker thread '''
+        summary = None
+        if plan.dropped and self.context.strategy == "summarize":
+            request = context.summary_request(plan.summary, plan.dropped)
+            summary = retry.call(lambda: gptCode(key, model, request),
+                                 opts['retries'], limiter=self.limiter,
+                                 cancelled=job.cancelled)
+            job.summary = (summary, plan.upto)
+        messages = context.messages(plan, summary)
+        return self.model_request(job, key, model, messages)
+
+    def model_request(self, job, key, model, messages):
+        ''' one chat completion, streamed if stream=on, inside the
+            rate limits and retried on 429s and server errors
+            (a stream is not retried once it has shown text) '''
+        cache_key = f"wxaichat-{self.named_session.id}"  # one prompt cache per session
+        def once():
+            if opts['stream']:
+                return gptStream(key, model, messages, job, opts['timeout'], cache_key)
+            if not opts['hedge']:
+                return retry.timed(lambda: gptCode(key, model, messages, job, opts['timeout'],
+                                                   cache_key), self.latency)
+            reply, attempt = retry.timed(lambda: retry.hedged(
+                lambda a: gptCode(key, model, messages, a, opts['timeout'], cache_key),
+                self.latency.hedge_after()), self.latency)
+            job.usage = attempt.usage
+            return reply
+
+        return retry.call(once, opts['retries'],
+                          tokens=sum(self.context.tokens(m) for m in messages),
+                          limiter=self.limiter, cancelled=job.cancelled,
+                          can_retry=lambda: job.ttft is None,
+                          on_retry=lambda n, delay, e: wx.CallAfter(self.on_retry, n, delay, e))
+
+    def on_retry(self, attempt, delay, error):
+        status = getattr(error, "status_code", None) or type(error).__name__
+        self.SetStatusText(f"{status}: retry {attempt} of {opts['retries']} in {delay:.1f}s")
+
+    def on_stream(self, event):
+        ''' show streamed deltas of the current reply '''
+        job = event.job
+        if job is not self.chat_job or job.is_cancelled():
+            return
+        if not job.shown:
+            job.shown = True
             self.text2.SetValue("")
-            self.text1.SetValue("")
+            self.codes.reset()
+        self.text2.AppendText(event.text)
+        self.codes.feed(event.text)
+        self.codes_dirty = False
+        if self.speech is not None:
+            self.speech.feed(event.text)
+        job.text += event.text
+        if self.preview is not None and self.preview.IsShown():
+            self.preview.set_tail(job.text)
+
+    def on_result(self, event):
+        ''' a background job has finished '''
+        job = event.job
+        if job.kind == "chat":
+            self.finish_chat(job, event.result, event.error)
+        elif job.kind == "attach":
+            self.finish_attach(job, event.result, event.error)
+        elif job.kind == "voice":
+            if event.error is not None or event.result != 0:
+                wx.MessageBox("There is a problem with the voice playback",
+                              "OpenVOC Error", wx.OK | wx.ICON_ERROR)
+
+    def finish_chat(self, job, ai_text, error):
+        ''' take the reply into the conversation, then
+            start the next queued prompt, if any '''
+        self.chat_job = None
+        self.stop_btn.Enable(False)
+        self.show_timing(job)
+
+        if job.is_cancelled() or error is not None or not ai_text:
+            # drop the unanswered user message
+            if self.conversation[-1]["role"] == "user":
+                self.conversation.pop()
+            self.stop_speech()
+            if job.is_cancelled():
+                self.SetStatusText("Stopped")
+                if self.text1.GetValue() == "":
+                    self.text1.SetValue(job.query)
+            else:
+                # keep the prompt, it can be sent again (Alt-Ctrl-Y)
+                self.failed.append((job.query, True))
+                reason = str(error) if error is not None else "empty reply"
+                self.text2.SetValue(f"Request failed: {reason}\n\nPROMPT:\n{job.query}\n\n"
+                                    f"{len(self.failed)} failed prompt(s) kept, "
+                                    "Alt-Ctrl-Y sends them again.")
+                self.SetStatusText(f"Request failed, {len(self.failed)} prompt(s) kept")
+            self.next_prompt()
             return
 
-        # 3) add the assistant reply to history
+        # 4) add the assistant reply to history
         self.conversation.append(
             {"role": "assistant", "content": ai_text}
         )
+        self.sessions.append(self.named_session, self.conversation[-2:], opts['model'])
+        if job.summary is not None:
+            self.context.update_summary(*job.summary)
+            summary, upto = job.summary
+            self.sessions.set_summary(self.named_session, summary,
+                                      self.named_session.first + upto - 1)
+        if job.cache_key is not None:
+            self.cache.put(job.cache_key, ai_text)
 
-        # 4) show it
-        self.text2.SetValue(ai_text)
-
-        # append to log.md ?
-        if opts[5].lower() == "on":
-            today = strftime("%a %d %b %Y", localtime())
-            tm    = strftime("%H:%M", localtime())
-            with open("log.md", "a", encoding="utf-8") as fout:
-                fout.write("\n\n=== Chat on %s %s ===\n\n" % (today, tm))
-                for msg in self.conversation:
-                    role = msg["role"]
-                    fout.write(f"{role.upper()}:\n{msg['content']}\n\n")
-                fout.write("="*40 + "\n\n")
-
-        # clear the input query box
-        self.text1.SetValue("")
-        # Speak response, if speach is on ...
-        if self.playback is True:
-            self.speak_text(ai_text)
+        # 5) show it (a streamed reply is already shown)
+        if job.shown:
+            self.codes.finish()
+            self.codes_dirty = False
+        else:
+            self.text2.SetValue(ai_text)
+
+        self.log_turn(job.query, ai_text, opts['model'])
+        self.update_preview()
+
+        # Speak the rest of the response, if speach is on ...
+        if self.speech is not None:
+            if not job.shown:  # not streamed
+                self.speech.feed(ai_text)
+            self.speech.finish()
+            self.speech = None
+        self.next_prompt()
+
+    def log_turn(self, query, reply, model):
+        ''' append the new messages to the log, if log=on
+            (the role once per log session) '''
+        if self.chatlog is None:
+            return
+        records = []
+        if not self.logged_role:
+            self.logged_role = True
+            records.append(chatlog.record(self.session, "system", opts['role']))
+        records.append(chatlog.record(self.session, "user", query))
+        records.append(chatlog.record(self.session, "assistant", reply, model))
+        self.chatlog.write(*records)
+
+    def on_compare(self):
+        ''' send the prompt to all models of options.ini at once (Alt-Ctrl-M) '''
+        query = self.text1.GetValue()
+        models = [m.strip() for m in opts['models'].split(",") if m.strip()]
+        if query.strip() == "" or not models:
+            return
+        if self.compare:
+            self.compare.Close()
+        import compare
+        user = {"role": "user", "content": query}
+        plan = self.context.plan(self.conversation + [user], move=False)
+        if self.attachments:
+            user["content"] = self.attachments.compose(
+                query, plan.tail[:-1], opts['attach_tokens'])[0]
+            plan = self.context.plan(self.conversation + [user], move=False)
+        self.compare = compare.CompareFrame(
+            self, models, opts['openai'], context.messages(plan), self.model_request,
+            lambda model, reply: self.keep_reply(query, model, reply, user["content"]),
+            self.prices, opts['compare_workers'], self.metrics)
+
+    def keep_reply(self, query, model, reply, content=None):
+        ''' take the reply picked in the compare window or the job panel
+            into the conversation, False if a request is running
+            content is the message sent for query (with attached files) '''
+        if self.chat_job is not None:
+            wx.MessageBox("Wait for the running request to finish", "Compare")
+            return False
+        self.close_pager()
+        self.conversation.append({"role": "user", "content": content or query})
+        self.conversation.append({"role": "assistant", "content": reply})
+        self.sessions.append(self.named_session, self.conversation[-2:], model)
+        if self.text1.GetValue() == query:
+            self.text1.SetValue("")
+        self.text2.SetValue(reply)
+        self.log_turn(query, reply, model)
+        self.update_preview()
+        self.SetStatusText(f"Kept the reply of {model}")
+        return True
+
+    def on_jobs(self):
+        ''' show the job panel (Alt-Ctrl-J) '''
+        if self.job_panel is None:
+            import jobs
+            self.job_panel = jobs.JobsFrame(
+                self, opts['openai'], opts['model'], self.model_request,
+                self.job_messages, self.keep_reply, self.prices,
+                opts['job_workers'], self.metrics)
+            return
+        self.job_panel.model = opts['model']
+        self.job_panel.prices = self.prices
+        self.job_panel.metrics = self.metrics
+        self.job_panel.Show()
+        self.job_panel.Raise()
+
+    def job_messages(self, prompt, fork):
+        ''' the messages of a job: the role and the prompt, or for a
+            fork the conversation so far and the prompt '''
+        user = {"role": "user", "content": prompt}
+        if not fork:
+            return [self.conversation[0], user]
+        return context.messages(self.context.plan(self.conversation + [user], move=False))
+
+    # ----------------------------
+    #   Attached files
+    # ----------------------------
+
+    def on_attach(self):
+        ''' attach files to the next prompts (Shift-Ctrl-A),
+            Cancel offers to detach the attached ones '''
+        dlg = wx.FileDialog(self, "Attach files", style=wx.FD_OPEN | wx.FD_MULTIPLE
+                            | wx.FD_FILE_MUST_EXIST)
+        if dlg.ShowModal() == wx.ID_OK:
+            paths = dlg.GetPaths()
+            self.SetStatusText(f"Reading {len(paths)} file(s) ...")
+            self.file_worker.submit(reqworker.Job("attach", attach.read_files, paths))
+        elif self.attachments and wx.MessageBox(
+                f"Detach the {self.attachments.describe()}?", "Attach",
+                wx.YES_NO | wx.ICON_QUESTION) == wx.YES:
+            self.attachments.clear()
+            self.SetStatusText("Files detached")
+        dlg.Destroy()
+
+    def finish_attach(self, job, files, error):
+        if error is not None:
+            wx.MessageBox(str(error), "Attach", wx.OK | wx.ICON_ERROR)
+            return
+        problems = []
+        for path, chunks, problem in files:
+            if problem:
+                problems.append(problem)
+            else:
+                self.attachments.add(path, chunks)
+        self.SetStatusText(f"{self.attachments.describe()}   read in {job.total():.2f}s")
+        if problems:
+            wx.MessageBox("\n".join(problems), "Attach", wx.OK | wx.ICON_WARNING)
+
+    # ----------------------------
+    #   Named sessions (sessions.db)
+    # ----------------------------
+
+    def open_session(self, session=None):
+        ''' continue a saved session (a new one if None); only
+            its newest messages are read '''
+        if session is None:
+            session = self.sessions.create(
+                strftime("Chat %d %b %Y %H:%M"), opts['role'])
+        self.close_pager()
+        self.named_session = session
+        role = session.role or opts['role']
+        self.conversation = [{"role": "system", "content": role}]
+        self.conversation.extend(self.sessions.load_tail(session))
+        self.context.reset()
+        self.sync_summary()
+        self.session = chatlog.new_session_id()  # a new log section
+        self.logged_role = False
+        if len(self.conversation) > 1:
+            self.text2.SetValue(self.conversation[-1]["content"])
+        self.SetStatusText(f"Session '{session.name}': {len(self.conversation) - 1} of "
+                           f"{session.messages} messages loaded")
+        self.update_preview()
+
+    def load_older(self):
+        ''' read the previous chunk of the session into the conversation '''
+        older = self.sessions.load_older(self.named_session)
+        self.conversation[1:1] = older
+        self.context.inserted(len(older))
+        self.sync_summary()
+        return len(older)
+
+    def sync_summary(self):
+        ''' the saved summary, with its end as an index in the conversation '''
+        session = self.named_session
+        if session.summary and session.summary_upto > session.first:
+            self.context.update_summary(session.summary,
+                                        1 + session.summary_upto - session.first)
+        elif session.summary:
+            self.context.update_summary(session.summary, 1)
+
+    def needs_older(self, plan):
+        ''' the plan has room for messages not read from sessions.db yet '''
+        session = self.named_session
+        covered = session.summary_upto if self.context.strategy == "summarize" else 0
+        return (not plan.dropped and plan.upto <= max(1, self.context.summary_upto)
+                and session.first > covered)
+
+    def on_sessions(self):
+        ''' switch to another session or start a new one (Shift-Ctrl-S) '''
+        if self.chat_job is not None:
+            wx.MessageBox("Wait for the running request to finish", "Sessions")
+            return
+        saved = self.sessions.list()
+        choices = ["+ New session"] + [s.describe() for s in saved]
+        dlg = wx.SingleChoiceDialog(self, "Continue, rename or delete a session",
+                                    "Sessions", choices)
+        if dlg.ShowModal() == wx.ID_OK:
+            n = dlg.GetSelection()
+            if n == 0:
+                name = wx.GetTextFromUser("Name of the new session", "Sessions",
+                                          strftime("Chat %d %b %Y %H:%M"), self)
+                if name.strip():
+                    self.open_session(self.sessions.create(name.strip(), opts['role']))
+            else:
+                self.session_action(saved[n - 1])
+        dlg.Destroy()
+
+    def session_action(self, session):
+        ''' continue, rename or delete the session picked '''
+        action = wx.GetSingleChoice(f"'{session.name}'", "Sessions",
+                                    ["Continue", "Rename", "Delete"], self)
+        if action == "Continue":
+            self.open_session(session)
+        elif action == "Rename":
+            name = wx.GetTextFromUser("New name", "Sessions", session.name, self).strip()
+            if name and name != session.name:
+                try:
+                    self.sessions.rename(session, name)
+                except sqlite3.IntegrityError:
+                    wx.MessageBox(f"There is already a session '{name}'", "Sessions")
+                    return
+                if session.id == self.named_session.id:
+                    self.named_session.name = name
+                self.SetStatusText(f"Session renamed to '{name}'")
+        elif action == "Delete":
+            if wx.MessageBox(f"Delete '{session.name}' and its {session.messages} messages?",
+                             "Sessions", wx.YES_NO | wx.ICON_WARNING) != wx.YES:
+                return
+            self.sessions.delete(session)
+            if session.id == self.named_session.id:
+                self.open_session(self.sessions.latest())  # or a new one
+            self.SetStatusText(f"Session '{session.name}' deleted")
+
+    def on_retry_failed(self):
+        ''' send the failed prompts again, in order (Alt-Ctrl-Y) '''
+        if not self.failed:
+            self.SetStatusText("No failed prompts")
+            return
+        self.prompt_queue.extend(self.failed)
+        self.SetStatusText(f"{len(self.failed)} failed prompt(s) queued again")
+        self.failed.clear()
+        self.next_prompt()
 
+    def next_prompt(self):
+        ''' start the oldest queued prompt '''
+        if self.prompt_queue and self.chat_job is None:
+            self.start_chat(*self.prompt_queue.popleft())
 
-    def gptCode(self, key: str, model: str, messages: str) -> str:
-        """Call the OpenAI ChatCompletion endpoint."""
-        try:
-            client = OpenAI(api_key=os.environ.get(key))
-            resp = client.chat.completions.create(
-            model    = model,
-            messages = messages)
-            return resp.choices[0].message.content.strip()
-        except Exception as e:
-            wx.MessageBox(str(e), "Error", wx.OK | wx.ICON_ERROR)
-            return ""
+    def on_metrics(self):
+        ''' timings, tokens and cost of this session so far '''
+        if self.metrics is None:
+            wx.MessageBox("Metrics need metrics=on", "Metrics")
+            return
+        lines = []
+        for kind in ("chat", "compare", "job", "tts", "speech"):
+            total = self.metrics.session_total(kind)
+            if total.records:
+                lines.append(f"{kind}:\n    " + total.line().replace("   ", "\n    "))
+        wx.MessageBox("\n\n".join(lines) or "No requests yet", "Session metrics")
+
+    def on_clear_cache(self):
+        ''' empty the reply cache '''
+        if self.cache is not None:
+            self.cache.clear()
+            self.SetStatusText("Reply cache cleared")
+
+    def on_stop(self, event=None):
+        ''' Event handler for the Stop button (Esc)
+            the request is given up at once (a stream is closed), a
+            late result is dropped and the next prompt can go out '''
+        job = self.chat_job
+        if job is not None:
+            self.worker.abandon(job)
+            self.finish_chat(job, None, None)
+
+    def show_timing(self, job):
+        ''' put the last request timings, tokens and cost in the
+            status bar and add them to metrics.jsonl '''
+        if job.started is None:
+            return  # answered from the cache
+        rec = metrics.job_record("chat", job, opts['model'], self.prices)
+        timing = f"queue {rec['queue']:.2f}s   "
+        if rec['ttft'] is not None:
+            timing += f"first token {rec['ttft']:.2f}s   "
+        self.SetStatusText(timing + f"total {rec['total']:.2f}s")
+        if self.metrics is not None:
+            rec = self.metrics.add(rec)
+        if job.usage is None:
+            return  # stopped or failed
+        usage = (f"{rec['prompt']} in ({rec['cached']} cached, "
+                 f"{metrics.ratio(rec['cached'], rec['prompt']):.0%}) / "
+                 f"{rec['completion']} out")
+        if rec['cost'] is not None:
+            usage += f"   ${rec['cost']:.5f} (saved ${rec['saved']:.5f})"
+        if rec.get('saved_s'):
+            usage += f"   ~{rec['saved_s']:.2f}s saved"
+        if self.metrics is not None:
+            session = self.metrics.session_total("chat")
+            usage += "   session " + session.cache_line()
+        self.SetStatusText(usage, 1)
 
     def speak_text(self, text: str):
-        ''' Speak the query response text '''
+        ''' Speak the query response text (on the voice worker) '''
         # text = self.getmdtext()  # get selected or all text
-        x = openvoc.textospeech(opts[10], 'speek.mp3', text)
-        if x != 0:
-            messagebox.showerror("OpenVOC Error",
-                                 "There is a problem with the voice playback")
+        self.voice_worker.submit(reqworker.Job(
+            "voice", self.voice_request, opts['voice'], text))
+
+    def stop_speech(self):
+        ''' cut off a reply being spoken '''
+        if self.speech is not None:
+            self.speech.cancel()
+            self.speech = None
+
+    def on_speech_error(self, message):
+        ''' called from the speech threads '''
+        wx.CallAfter(wx.MessageBox, "There is a problem with the voice playback\n" + message,
+                     "OpenVOC Error", wx.OK | wx.ICON_ERROR)
+
+    def replay_answer(self):
+        ''' speak the last answer again (from the audio cache) '''
+        if self.conversation[-1]["role"] != "assistant":
+            return
+        self.stop_speech()
+        self.speech = openvoc.SpeechPipeline(opts['voice'], on_error=self.on_speech_error,
+                                             cache=True)
+        self.speech.feed(self.conversation[-1]["content"])
+        self.speech.finish()
+
+    def voice_request(self, job, voice, text):
+        ''' runs on the voice worker thread '''
+        return openvoc.textospeech(voice, 'speek.mp3', text)
 
     def toggle_speak_text(self, e=None):
         ''' toggle voice playback of each response
         Requires mpv for Linux. Nothing for Windows. '''
         if self.playback == True:
             self.playback = False
+            self.stop_speech()
             # announce it
-            x = openvoc.textospeech(
-                                    opts[10],
-                                    'speek.mp3',
-                                    "Voice playback is now off.")
+            self.speak_text("Voice playback is now off.")
         else:
             self.playback = True
             # announce it
-            x = openvoc.textospeech(
-                                    opts[10],
-                                    'speek.mp3',
-                                    "Voice playback is now on.")
-        if x != 0:
-            messagebox.showerror("OpenVOC Error",
-                                 "There is a problem with the voice")
+            self.speak_text("Voice playback is now on.")
 
 
     def on_key_down_hotkeys(self, event):
@@ -401,16 +1208,53 @@ class MyFrame(wx.Frame):
 
         if modifiers == (wx.MOD_CONTROL | wx.MOD_ALT) and keycode == ord('C'):  # Ctrl-Alt C on copy code
             self.on_copy_code()
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_ALT) and ord('1') <= keycode <= ord('9'):  # copy block N
+            self.on_copy_code(keycode - ord('0'))
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_ALT) and keycode == ord('A'):  # copy all code
+            self.on_copy_all_code()
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_ALT) and keycode == ord('S'):  # save code block
+            self.on_save_code()
         elif modifiers == (wx.MOD_CONTROL | wx.MOD_ALT) and keycode == ord('V'):  # toggle voice
             self.toggle_speak_text()
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_ALT) and keycode == ord('R'):  # replay answer
+            self.replay_answer()
+        elif (modifiers == wx.MOD_NONE and keycode == wx.WXK_PAGEUP
+              and self.pager is not None and self.text2.GetInsertionPoint() == 0):
+            self.view_earlier()  # PageUp at the top of the log
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_SHIFT) and keycode == ord('L'):  # export log
+            self.on_export_log()
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_SHIFT) and keycode == ord('F'):  # search history
+            self.on_history()
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_SHIFT) and keycode == ord('S'):  # sessions
+            self.on_sessions()
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_SHIFT) and keycode == ord('A'):  # attach files
+            self.on_attach()
         elif modifiers == wx.MOD_CONTROL and keycode == ord('F'):  # Ctrl+F: open search dialog.
             self.doSearchDialog()
         elif modifiers == wx.MOD_CONTROL and keycode == ord('N'):  # Ctrl+N: find next occurrence.
             self.findNext()
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_SHIFT) and keycode == ord('N'):  # find previous
+            self.findNext(backward=True)
         elif modifiers == wx.MOD_CONTROL and keycode == ord('G'):
             self.on_submit(event)
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_SHIFT) and keycode == ord('G'):  # skip the cache
+            self.on_submit(event, use_cache=False)
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_ALT) and keycode == ord('K'):  # clear the cache
+            self.on_clear_cache()
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_ALT) and keycode == ord('M'):  # compare models
+            self.on_compare()
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_ALT) and keycode == ord('T'):  # session metrics
+            self.on_metrics()
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_ALT) and keycode == ord('J'):  # job panel
+            self.on_jobs()
+        elif modifiers == (wx.MOD_CONTROL | wx.MOD_ALT) and keycode == ord('Y'):  # resend failed
+            self.on_retry_failed()
+        elif modifiers == wx.MOD_NONE and keycode == wx.WXK_ESCAPE:  # Esc: stop request
+            self.on_stop()
+        elif modifiers == wx.MOD_CONTROL and keycode == ord('P'):  # Ctrl+P: preview
+            self.on_preview()
         elif modifiers == wx.MOD_CONTROL and keycode == ord('Q'):
-            self.on_close(event)
+            self.Close()
         elif modifiers == wx.MOD_CONTROL and keycode == ord('H'):  # Ctrl+F: open search dialog.
             self.on_help_dialog()
         elif modifiers == wx.MOD_CONTROL and keycode == ord('O'):  # Ctrl+O: open editor with options
@@ -419,108 +1263,174 @@ class MyFrame(wx.Frame):
             event.Skip()  # Ensure other key events are processed
 
     def openEditor(self):
-        ''' Open text editor to alter options.ini '''
-        global opts
-        p = subprocess.Popen([opts[6], 'options.ini'])
-        p.wait()  # wait until editor closes
-        opts = []
-        opts = iniproc.read("options.ini", 'openai',    # 0
-                                           'model',     # 1
-                                           'fontsz1',   # 2
-                                           'fontsz2',   # 3
-                                           'role',      # 4
-                                           'log',       # 5
-                                           'editor',    # 6
-                                           'qheight',   # 7
-                                           'font1',     # 8
-                                           'font2',     # 9
-                                           'voice')     # 10
-        self.reLaunch()
+        ''' Open text editor to alter options.ini
+            changes are applied each time the file is saved '''
+        subprocess.Popen([opts['editor'], 'options.ini'])
+
+    def on_history(self):
+        ''' search all past sessions, show (and reload) an exchange '''
+        if self.history is None:
+            wx.MessageBox("History search needs log=on", "History")
+            return
+        dlg = historydlg.HistoryDialog(self, self.history)
+        if dlg.ShowModal() == wx.ID_OK and dlg.exchange:
+            self.close_pager()
+            self.text2.SetValue("".join(
+                f"{m['role'].upper()}:\n{m['content']}\n\n" for m in dlg.exchange))
+            if dlg.reload:
+                self.conversation.extend(dlg.exchange)
+                self.sessions.append(self.named_session, dlg.exchange)
+                self.SetStatusText("Exchange added to the conversation")
+                self.update_preview()
+        dlg.Destroy()
 
     def doSearchDialog(self):
-        # Open a dialog to accept search text.
-        dlg = wx.TextEntryDialog(self, "Enter text to search:", "Find")
+        # Open a dialog to accept search text and mode.
+        dlg = searchdlg.SearchDialog(self, self.search)
         if dlg.ShowModal() == wx.ID_OK:
-            self.search_text = dlg.GetValue()
-            # Start search from current insertion point.
-            self.search_pos = self.text2.GetInsertionPoint()
-            self.findNext()
+            error = self.search.set_query(**dlg.values())
+            if error:
+                wx.MessageBox(error, "Find", wx.OK | wx.ICON_ERROR)
+            else:
+                self.refresh_search()
+                self.highlight_matches()
+                # Start search from current insertion point.
+                self.findNext(dlg.backward)
         dlg.Destroy()
 
-    def findNext(self):
-        if not self.search_text:
+    def on_text2_changed(self, event):
+        ''' only marks the search text and code index stale,
+            they are brought up to date when next used '''
+        self.search_dirty = True
+        self.highlighted = False
+        self.codes_dirty = True
+        event.Skip()
+
+    def refresh_search(self):
+        ''' give the search engine the current text, if it changed '''
+        if self.search_dirty:
+            self.search.set_text(self.text2.GetValue())
+            self.search_dirty = False
+
+    def findNext(self, backward=False):
+        if not self.search.query:
             return  # Nothing to search.
+        if self.search_dirty:
+            self.refresh_search()
+        if not self.highlighted:
+            self.highlight_matches()  # once per content or query
 
-        # Get the full text from the TextCtrl.
-        full_text = self.text2.GetValue()
-        # For a case–insensitive search, convert both full text and search string to lower case.
-        lower_text = full_text.lower()
-        lower_search = self.search_text.lower()
-
-        # Search from the current position.
-        idx = lower_text.find(lower_search, self.search_pos)
-        if idx == -1:
-            # Optionally, notify the user if the search text is not found:
-            wx.MessageBox(f'"{self.search_text}" was not found.', "Find", wx.OK | wx.ICON_INFORMATION)
-            # Reset search position for a new search.
-            self.search_pos = 0
+        pos = None
+        if self.search.current is None:
+            pos = self.text2.GetInsertionPoint()  # the first step starts at the cursor
+        match = self.search.step(pos, backward)
+        if match is None:
+            # notify the user if the search text is not found:
+            wx.MessageBox(f'"{self.search.query}" was not found.', "Find", wx.OK | wx.ICON_INFORMATION)
         else:
             # Set focus to the TextCtrl and highlight the found text.
+            start, end = match
             self.text2.SetFocus()
-            self.text2.ShowPosition(idx)
-            self.text2.SetSelection(idx, idx + len(self.search_text))
-            # Update the search position for next search.
-            self.search_pos = idx + len(self.search_text)
-
-    def on_copy_code(self):
-        text = self.text2.GetValue()
-        lines = text.splitlines()
-        result = []
-        in_backticks = False
-
-        for line in lines:
-            if line.startswith('```'):
-                if in_backticks:
-                    break
-                else:
-                    in_backticks = True
-                    continue
-            else:
-                if in_backticks:
-                    result.append(line)  # Collect lines within the back-ticked region
-
-        # Join selected text and put it to the clipboard
-        if result:
-            clipboard_text = '\n'.join(result)
-            self.set_clipboard(clipboard_text)
-            wx.MessageBox('Copied to clipboard', "Code")
-        else:
+            self.text2.ShowPosition(start)
+            self.text2.SetSelection(start, end)
+            self.SetStatusText(f'"{self.search.query}" {self.search.position()}')
+
+    def highlight_matches(self):
+        ''' mark every match (up to MAX_HIGHLIGHT) in the response area '''
+        self.text2.highlight(self.search.matches()[:MAX_HIGHLIGHT], self.search.text)
+        self.highlighted = True
+
+    def on_preview(self):
+        ''' show or hide the rendered preview of the conversation '''
+        if self.preview is None:
+            import preview
+            self.preview = preview.PreviewFrame(self, self.renderer)
+        if self.preview.IsShown():
+            self.preview.Hide()
+            return
+        self.preview.Show()
+        self.update_preview()
+
+    def update_preview(self):
+        if self.preview is not None and self.preview.IsShown():
+            self.preview.set_messages(self.conversation)
+
+    def code_index(self):
+        ''' the code blocks of text2, parsed again only if it changed '''
+        if self.codes_dirty:
+            self.codes.parse(self.text2.GetValue())
+            self.codes_dirty = False
+        return self.codes
+
+    def on_copy_code(self, n=None):
+        ''' copy code block n, or the next one on each call '''
+        codes = self.code_index()
+        block = codes.next() if n is None else codes.get(n)
+        if block is None:
             wx.MessageBox('No text found between triple back-ticks.')
+            return
+        self.set_clipboard(block.text())
+        self.text2.ShowPosition(block.start)
+        self.text2.SetSelection(block.start, block.end)
+        self.SetStatusText(f"Copied code block {codes.current + 1} of "
+                           f"{len(codes.blocks)} ({block.describe()})")
+
+    def on_copy_all_code(self):
+        codes = self.code_index()
+        if not codes.blocks:
+            wx.MessageBox('No text found between triple back-ticks.')
+            return
+        self.set_clipboard(codes.all_text())
+        self.SetStatusText(f"Copied {len(codes.blocks)} code blocks")
+
+    def on_save_code(self):
+        ''' save the code block last copied (or the first) to a file '''
+        codes = self.code_index()
+        if not codes.blocks:
+            wx.MessageBox('No text found between triple back-ticks.')
+            return
+        block = codes.blocks[max(codes.current, 0)]
+        dlg = wx.FileDialog(self, "Save code block", defaultFile="code." + block.extension(),
+                            style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
+        if dlg.ShowModal() == wx.ID_OK:
+            with open(dlg.GetPath(), "w", encoding="utf-8") as fout:
+                fout.write(block.text() + "\n")
+            self.SetStatusText("Saved " + dlg.GetPath())
+        dlg.Destroy()
 
     def set_clipboard(self, text):
         if wx.TheClipboard.Open():
             wx.TheClipboard.SetData(wx.TextDataObject(text))
             wx.TheClipboard.Close()
 
-    def reLaunch(self):
-        ''' close and re-open this instance '''
-        wx.MessageBox('App will now close and re-open...')
-        python = sys.executable
-        #self.Destroy()
-        self.on_close(None)
-        os.execl(python, python, *sys.argv)
-
     def on_help_dialog(self):
         msg = '''
         Ctrl-H     This help message\n
         Ctrl-F     Find text\n
+        Shift-Ctrl-F Search history\n
+        Shift-Ctrl-L Export log to log.export.md\n
+        Shift-Ctrl-S Switch, rename or delete sessions, or start a new one\n
+        Shift-Ctrl-A Attach files (Cancel to detach them)\n
         Ctrl-N     Find next\n
+        Shift-Ctrl-N Find previous\n
+        Ctrl-P     Show/hide rendered preview\n
         Ctrl-Q     Quit App\n
         Ctrl-G     Execute AI request\n
+        Shift-Ctrl-G Execute AI request, skip the cache\n
+        Esc        Stop AI request\n
         Ctrl-O     Open options in editor\n
         Alt-Ctrl-V Toggle voice
+        Alt-Ctrl-R Replay last answer
+        Alt-Ctrl-K Clear the reply cache
+        Alt-Ctrl-M Compare the prompt across models
+        Alt-Ctrl-J Job panel: run many prompts at once
+        Alt-Ctrl-T Show timings, tokens and cost of the session
+        Alt-Ctrl-Y Send the failed prompts again
         Alt-Ctrl-C
-                   Copy Code in Markup\n
+                   Copy next Code block in Markup\n
+        Alt-Ctrl-1..9 Copy Code block 1..9\n
+        Alt-Ctrl-A Copy all Code blocks\n
+        Alt-Ctrl-S Save Code block to a file\n
         '''
         #wx.MessageBox(msg)
         wx.MessageBox(msg, 'Command Keys' , wx.OK)
@@ -528,10 +1438,22 @@ class MyFrame(wx.Frame):
 
 class MyApp(wx.App):
     def OnInit(self):
+        t_imports = perf_counter() - T_START
         frame = MyFrame(None)
         self.SetTopWindow(frame)
+        if os.environ.get("WXAICHAT_STARTUP_BENCH"):
+            # report startup timings and quit (bench/startup.py)
+            modules = sorted(sys.modules)  # before the background preload
+            def report():
+                print(json.dumps({"imports": t_imports,
+                                  "shown": perf_counter() - T_START,
+                                  "modules": modules}), flush=True)
+                frame.Destroy()
+            wx.CallAfter(report)
         return True
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ["--batch"]:
+        sys.exit(run_batch(sys.argv[2:]))
     app = MyApp(False)
     app.MainLoop()